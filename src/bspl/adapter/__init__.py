@@ -1,3 +1,7 @@
 from .scheduler import Scheduler
 from .core import Adapter
 from .policies import Remind, Forward, Send
+from .retention import Retention
+from .persistence import Journal
+from .codec import Codec
+from .overload import EventQueue
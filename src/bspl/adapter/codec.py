@@ -0,0 +1,237 @@
+"""
+Compact binary wire format for messages.
+
+Instead of JSON objects with the full schema name and parameter names, each
+message is sent as a small schema ID followed by its parameter values in
+schema order.  Peers agree on the IDs by deriving the same schema table from
+the protocols they have loaded, so both must be configured with the same
+systems.
+
+Encoded messages are length-prefixed, so they can still be bundled into
+'[' ... ',' ... ']' datagrams by the existing emitters.
+
+Example:
+  codec = Codec(systems)
+  Adapter(name, systems, agents,
+          emitter=BundlingEmitter(encoder=codec.encode),
+          receiver=Receiver(address, decoder=codec.decode))
+
+The default JSON format also gets a specialized encoder and decoder per
+schema (json_encoder and json_decoder), which Adapter.inject installs on
+each schema.
+"""
+
+import json
+import struct
+import logging
+from json.encoder import encode_basestring_ascii as quote
+from .message import Message
+
+logger = logging.getLogger("bspl.codec")
+
+# value tags
+MISSING, NONE, FALSE, TRUE, INT, FLOAT, STR, JSON = range(8)
+
+double = struct.Struct("<d")
+absent = object()  # decoded value of an unbound parameter
+
+
+def write_varint(out, n):
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def read_varint(data, pos):
+    n = shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+def write_value(out, value):
+    if value is None:
+        out.append(NONE)
+    elif value is True:
+        out.append(TRUE)
+    elif value is False:
+        out.append(FALSE)
+    elif type(value) is int:
+        out.append(INT)
+        # zigzag, so small negative numbers stay small
+        write_varint(out, value << 1 if value >= 0 else (-value << 1) - 1)
+    elif type(value) is float:
+        out.append(FLOAT)
+        out += double.pack(value)
+    elif type(value) is str:
+        b = value.encode()
+        out.append(STR)
+        write_varint(out, len(b))
+        out += b
+    else:
+        b = json.dumps(value, separators=(",", ":")).encode()
+        out.append(JSON)
+        write_varint(out, len(b))
+        out += b
+
+
+def read_value(data, pos):
+    tag = data[pos]
+    pos += 1
+    if tag == NONE:
+        return None, pos
+    if tag == TRUE:
+        return True, pos
+    if tag == FALSE:
+        return False, pos
+    if tag == INT:
+        n, pos = read_varint(data, pos)
+        return (n >> 1) ^ -(n & 1), pos
+    if tag == FLOAT:
+        return double.unpack_from(data, pos)[0], pos + 8
+    if tag == STR or tag == JSON:
+        n, pos = read_varint(data, pos)
+        s = bytes(data[pos : pos + n]).decode()
+        return (s if tag == STR else json.loads(s)), pos + n
+    if tag == MISSING:
+        return absent, pos
+    raise Exception(f"Unknown value tag {tag} at position {pos - 1}")
+
+
+def schema_table(systems):
+    """List every message schema of the systems' protocols, in a stable order"""
+    schemas = {
+        schema.qualified_name: schema
+        for s in systems.values()
+        for schema in s["protocol"].messages.values()
+    }
+    return [schemas[name] for name in sorted(schemas)]
+
+
+class Codec:
+    def __init__(self, systems):
+        """
+        systems: the systems the adapter participates in; peers must agree on
+          the set of protocols, since schema IDs are derived from them
+        """
+        self.schemas = schema_table(systems)
+        self.ids = {schema.qualified_name: i for i, schema in enumerate(self.schemas)}
+        self.fields = [tuple(schema.public_parameters) for schema in self.schemas]
+
+    def encode(self, message):
+        """Encode a message as a length-prefixed schema ID and positional values"""
+        id = self.ids[message.schema.qualified_name]
+        body = bytearray()
+        write_varint(body, id)
+        write_value(body, message.system)
+        meta = message._meta
+        if meta is not None and len(meta) > 1:
+            write_value(body, {k: v for k, v in meta.items() if k != "system"})
+        else:
+            body.append(NONE)
+        payload = message.payload
+        for p in self.fields[id]:
+            if p in payload:
+                write_value(body, payload[p])
+            else:
+                body.append(MISSING)
+        out = bytearray()
+        write_varint(out, len(body))
+        return bytes(out + body)
+
+    def decode_message(self, data, pos=0):
+        """Decode one message starting at pos; return it and the position after it"""
+        length, pos = read_varint(data, pos)
+        end = pos + length
+        id, pos = read_varint(data, pos)
+        schema = self.schemas[id]
+        system, pos = read_value(data, pos)
+        meta, pos = read_value(data, pos)
+        meta = {**(meta or {}), "system": system}
+        payload = {}
+        for p in self.fields[id]:
+            value, pos = read_value(data, pos)
+            if value is not absent:
+                payload[p] = value
+        if pos != end:
+            raise Exception(f"Malformed {schema.qualified_name} message")
+        return {"schema": schema.qualified_name, "payload": payload, "meta": meta}, end
+
+    def decode(self, data):
+        """Decode a '[' ... ',' ... ']' bundle of encoded messages"""
+        data = memoryview(data)
+        if data[0] != ord("["):
+            raise Exception("Bundle must start with '['")
+        messages = []
+        if len(data) == 2:
+            return messages
+        pos = 1
+        while True:
+            message, pos = self.decode_message(data, pos)
+            messages.append(message)
+            if data[pos] == ord("]"):
+                return messages
+            if data[pos] != ord(","):
+                raise Exception(f"Expected ',' between messages at position {pos}")
+            pos += 1
+
+
+dumps = json.JSONEncoder(separators=(",", ":")).encode
+
+
+def json_value(value):
+    t = type(value)
+    if t is str:
+        return quote(value)
+    if t is int:
+        return int.__repr__(value)
+    return dumps(value)
+
+
+def json_encoder(schema):
+    """
+    Generate a JSON encoder for messages of schema, writing the parameters of
+    its payload record in schema order without building an intermediate dict.
+
+    Produces the same JSON as encoding Message.serialize(), up to key order.
+    """
+    record = schema.record
+    fields = tuple((quote(p) + ":", slot) for p, slot in record.slots.items())
+    prefix = '{"schema":' + quote(schema.qualified_name) + ',"payload":{'
+
+    def encode(message):
+        payload = message.payload
+        if type(payload) is not record:
+            return dumps(message.serialize()).encode()
+        parts = []
+        for name, slot in fields:
+            value = getattr(payload, slot, absent)
+            if value is not absent:
+                parts.append(name + json_value(value))
+        meta = message._meta
+        if meta is None:
+            meta = '{"system":' + json_value(message._system) + "}"
+        else:
+            meta = dumps(meta)
+        return (prefix + ",".join(parts) + '},"meta":' + meta + "}").encode()
+
+    return encode
+
+
+def json_decoder(schema):
+    """Generate a decoder that builds messages of schema directly from their parsed JSON"""
+    record = schema.record
+
+    def decode(data):
+        try:
+            payload = record(data["payload"])
+        except KeyError:
+            payload = data["payload"]  # not a payload of this schema; keep the dict
+        return Message(schema, payload, meta=data.get("meta"))
+
+    return decode
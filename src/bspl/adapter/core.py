@@ -8,28 +8,31 @@ import os
 import math
 import socket
 import inspect
+import itertools
 import yaml
 import agentspeak
 import agentspeak.stdlib
 import random
 import colorama
 from types import MethodType
-from asyncio.queues import Queue
 from .store import Store
-from .message import Message
+from .message import Message, record_class, is_path
 from functools import partial
-from .emitter import Emitter
-from .receiver import Receiver
+from .emitter import Emitter, UnixEmitter, MixedEmitter
+from .receiver import Receiver, UnixReceiver
+from .overload import EventQueue
+from .lanes import Lanes, enactment
 from .scheduler import Scheduler, exponential
 from .statistics import stats, increment
 from .jason import Environment, Agent, Actions, actions
 from .event import Event, ObservationEvent, ReceptionEvent, EmissionEvent, InitEvent
 from . import policies
+from . import sharding
+from . import codec
 from ..protocol import Parameter
 import bspl
 import bspl.adapter.jason
 import bspl.adapter.schema
-from bspl.utils import identity
 
 FORMAT = "%(asctime)-15s %(module)s: %(message)s"
 logging.basicConfig(format=FORMAT, level=logging.INFO)
@@ -48,6 +51,28 @@ COLORS = [
 ]
 
 
+def match_fields(event, kwargs):
+    for k in kwargs:
+        if k in event:
+            return event[k] == kwargs[k]
+
+
+def merge(events):
+    """Merge observation events into one event per kind of observation"""
+    if len(events) == 1:
+        return events
+    receptions = [
+        m for e in events if isinstance(e, ReceptionEvent) for m in e.messages
+    ]
+    emissions = [m for e in events if isinstance(e, EmissionEvent) for m in e.messages]
+    merged = [e for e in events if not isinstance(e, (ReceptionEvent, EmissionEvent))]
+    if receptions:
+        merged.append(ReceptionEvent(*receptions))
+    if emissions:
+        merged.append(EmissionEvent(emissions))
+    return merged
+
+
 def select_endpoint(agent_endpoints, system_name):
     """
     Select one endpoint from a list of agent endpoints using deterministic hash-based selection.
@@ -74,17 +99,37 @@ def select_endpoint(agent_endpoints, system_name):
         return agent_endpoints
 
 
+def default_emitter(agents):
+    """A datagram emitter for the kinds of endpoints in agents: socket paths, (host, port) pairs, or both"""
+    paths = set()
+    for endpoints in agents.values():
+        if not isinstance(endpoints, list):
+            endpoints = [endpoints]
+        paths.update(is_path(e) for e in endpoints)
+    if paths == {True, False}:
+        return MixedEmitter()
+    if paths == {True}:
+        return UnixEmitter()
+    return Emitter()
+
+
 class Adapter:
     def __init__(
         self,
         name,
         systems,
         agents,
-        emitter=Emitter(),
+        emitter=None,
         receiver=None,
         color=None,
         in_place=False,
         debug=False,
+        retention=None,
+        journal=None,
+        history=None,
+        coalesce=False,
+        events=None,
+        concurrency=None,
         **kwargs,
     ):
         """
@@ -93,11 +138,20 @@ class Adapter:
         name: name of this agent
         systems: a list of MAS to participate in
         agents: a dictionary mapping agent names to endpoints
-        emitter: encodes messages for transmission over the network
+        emitter: encodes messages for transmission over the network; by default
+          a datagram emitter for the kinds of endpoints in agents
         receiver: reads messages from the network and decodes them
         color: distinguish agent by color in console logs
         in_place: detect completed forms instead of using return value
         debug: turn on debug logging when True
+        retention: a Retention policy for evicting completed enactments from the history
+        journal: a Journal for persisting the history; the history is restored from it on startup
+        history: a Store to use for the history instead of the default in-memory one
+        coalesce: process all pending events together in each update, with one
+          enabled set update, one round of decisions and one send for their emissions
+        events: an EventQueue for pending events, to bound them under overload
+        concurrency: run up to this many reactors and decision handlers at once,
+          in order within each enactment; by default they run one at a time
         """
         self.name = name
 
@@ -136,14 +190,20 @@ class Adapter:
         self.addresses = self.agents[self.name]
         self.reactors = {}  # dict of message -> [handlers]
         self.generators = {}  # dict of (scheema tuples) -> [handlers]
-        self.history = Store(systems)
-        self.emitter = emitter
+        self.generator_index = {}  # observed schema -> [schema tuples]
+        self.history = history or Store(
+            systems, index=True, dedup=True, retention=retention, journal=journal
+        )
+        self.emitter = emitter or default_emitter(agents)
         if receiver:
             self.receivers = [receiver]
         else:
             self.receivers = []
             for addr in self.addresses:
-                self.receivers.append(Receiver(addr))
+                if is_path(addr):
+                    self.receivers.append(UnixReceiver(addr))
+                else:
+                    self.receivers.append(Receiver(addr))
         self.schedulers = []
         self.messages = {
             message.qualified_name: message
@@ -154,12 +214,25 @@ class Adapter:
         for p in self.protocols:
             self.inject(p)
 
-        self.events = Queue()
+        # observed schema -> schemas whose enablement it can affect
+        self.dependents = {}
+        for p in self.protocols:
+            self.index_dependents(p)
+
+        self.events = events or EventQueue()
         self.enabled_messages = Store(systems)
+        # (kind, value) -> [(order, handler, arity, conditions, filter, kwargs)]
         self.decision_handlers = {}
+        self.decision_order = itertools.count()
         self._in_place = in_place
+        self.coalesce = coalesce
+        self.lanes = Lanes(concurrency) if concurrency else None
+        self.shard = None
         self.kwargs = kwargs
 
+        if self.history.journal:
+            self.restore()
+
     def debug(self, msg):
         self.logger.debug(msg)
 
@@ -170,7 +243,7 @@ class Adapter:
         self.logger.warning(msg)
 
     def inject(self, protocol):
-        """Install helper methods into schema objects"""
+        """Install helper methods and payload record types into schema objects"""
 
         from bspl.protocol import Message
 
@@ -179,14 +252,45 @@ class Adapter:
         for m in protocol.messages.values():
             m.match = MethodType(bspl.adapter.schema.match, m)
             m.adapter = self
-
-    async def receive(self, data):
-        if not isinstance(data, dict):
+            if not hasattr(m, "record"):
+                m.record = record_class(m)
+                m.encoder = codec.json_encoder(m)
+                m.decoder = codec.json_decoder(m)
+
+    def restore(self):
+        """Rebuild the history and enabled set from the history's journal"""
+        messages = self.history.journal.replay(self.history, self.messages)
+        if messages:
+            self.info(f"Restored {len(messages)} messages from {self.history.journal.path}")
+            self.compute_enabled(messages)
+
+    def index_dependents(self, protocol):
+        """
+        Index the schemas sent by this agent by the parameters they use, so
+        that an observation only needs to recheck the schemas that share a
+        parameter with it; no other schema's enablement can change.
+        """
+        users = {}
+        for schema in protocol.messages.values():
+            if schema.sender in self.roles:
+                for p in schema.public_parameters:
+                    users.setdefault(p, []).append(schema)
+        for schema in protocol.messages.values():
+            dependents = {}
+            for p in schema.public_parameters:
+                dependents.update(dict.fromkeys(users.get(p, [])))
+            self.dependents[schema] = tuple(dependents)
+
+    def accept(self, data):
+        """Decode and check a received message; return it if it is new and consistent with the history"""
+        if isinstance(data, Message):
+            # already decoded
+            message = data
+        elif not isinstance(data, dict):
             self.warning("Data does not parse to a dictionary: {}".format(data))
             return
-
-        schema = self.messages[data["schema"]]
-        message = Message(schema, data["payload"], meta=data.get("meta", {}))
+        else:
+            message = self.messages[data["schema"]].decoder(data)
         message.meta["received"] = datetime.datetime.now()
         if self.history.is_duplicate(message):
             self.debug("Duplicate message: {}".format(message))
@@ -194,12 +298,44 @@ class Adapter:
             # Don't react to duplicate messages
             # message.duplicate = True
             # await self.react(message)
+        elif self.events.shedding:
+            # overloaded; the sender will deliver it again
+            self.events.shed(message)
         elif self.history.check_integrity(message):
             self.debug("Received message: {}".format(message))
             increment("receptions")
             self.history.add(message)
+            return message
+
+    async def receive(self, data):
+        await self.events.admit()
+        message = self.accept(data)
+        if message is not None:
+            self.history.commit()
             await self.signal(ReceptionEvent(message))
 
+    async def receive_many(self, batch):
+        """
+        Receive a batch of messages, such as everything decoded from a burst of
+        datagrams, with a single ReceptionEvent for all the new ones
+        """
+        await self.events.admit()
+        messages = []
+        for data in batch:
+            try:
+                message = self.accept(data)
+            except Exception as e:
+                # e.g. an unknown schema or a conflicting payload; the rest of
+                # the batch is still received
+                self.warning(f"Rejected {data}: {e!r}")
+                continue
+            if message is not None:
+                messages.append(message)
+        if messages:
+            # log the whole batch with one commit before processing it
+            self.history.commit()
+            await self.signal(ReceptionEvent(*messages))
+
     async def send(self, *messages):
         def prep(message):
             # Handle multiple recipients by creating copies for each destination
@@ -210,7 +346,8 @@ class Adapter:
                 prepared_messages.append(message)
             else:
                 system = self.systems[message.system]
-                # Create a copy for each recipient
+                # Create a copy for each recipient; the copies share the
+                # payload, so emitters can encode them once
                 for recipient_role in message.schema.recipients:
                     recipient_agent = system["roles"][recipient_role]
                     agent_endpoints = self.agents[recipient_agent]
@@ -221,8 +358,8 @@ class Adapter:
                     # Create message copy with specific destination
                     msg_copy = Message(
                         message.schema,
-                        message.payload.copy(),
-                        message.meta.copy(),
+                        message.payload,
+                        message._meta,
                         message.acknowledged,
                         endpoint,
                         message.adapter,
@@ -232,13 +369,22 @@ class Adapter:
 
             return prepared_messages
 
-        # Flatten the list of message copies from prep
-        all_prepared = []
-        for m in messages:
+        if self.shard:
+            # hand messages for enactments owned by other shards to their owners
+            messages = self.shard.route(self, messages)
+            if not messages:
+                return
+
+        # The first copy of each message stands for it in the history and
+        # events; every copy is transmitted
+        emissions = []
+        copies = []
+        for m in dict.fromkeys(messages):
             if not self.history.is_duplicate(m):
                 prepared = prep(m)
-                all_prepared.extend(prepared)
-        emissions = set(all_prepared)
+                if prepared:
+                    emissions.append(prepared[0])
+                    copies.extend(prepared)
         if len(emissions) < len(messages):
             self.info(
                 f"Skipped {len(messages) - len(emissions)} duplicate messages: {set(messages).difference(emissions)}"
@@ -250,11 +396,13 @@ class Adapter:
                 increment("emissions")
                 increment("observations")
                 self.history.add(m)
-            if len(emissions) > 1 and hasattr(self.emitter, "bulk_send"):
-                self.debug(f"bulk sending {len(emissions)} messages")
-                await self.emitter.bulk_send(emissions)
+            # log the whole batch with one commit before anything is transmitted
+            self.history.commit()
+            if len(copies) > 1 and hasattr(self.emitter, "bulk_send"):
+                self.debug(f"bulk sending {len(copies)} messages")
+                await self.emitter.bulk_send(copies)
             else:
-                for m in emissions:
+                for m in copies:
                     await self.emitter.send(m)
             await self.signal(EmissionEvent(emissions))
 
@@ -291,9 +439,14 @@ class Adapter:
         """
         reactors = self.reactors.get(message.schema)
         if reactors:
-            for r in reactors:
-                message.adapter = self
-                await r(message)
+            message.adapter = self
+            if self.lanes:
+                keys = (enactment(self.systems, message),)
+                for r in reactors:
+                    await self.lanes.submit(keys, r, message)
+            else:
+                for r in reactors:
+                    await r(message)
 
     def enabled(self, *schemas, **options):
         """
@@ -308,18 +461,34 @@ class Adapter:
         return partial(self.register_generators, schemas=schemas, options=options)
 
     def register_generators(self, handler, schemas, options={}):
+        index = options.get("index")
         if schemas in self.generators:
             gs = self.generators[schemas]
             if handler not in gs:
                 gs.insert(index if index is not None else len(gs), handler)
         else:
             self.generators[schemas] = [handler]
+            self.generator_index.clear()
+        return handler
+
+    def generators_for(self, schema):
+        """
+        The generator schema tuples an observation of schema can newly enable:
+        those with a schema that depends on it
+        """
+        tuples = self.generator_index.get(schema)
+        if tuples is None:
+            dependents = self.dependents.get(schema, ())
+            tuples = self.generator_index[schema] = [
+                tup for tup in self.generators if any(s in dependents for s in tup)
+            ]
+        return tuples
 
     async def handle_enabled(self, message):
         """
         Handle newly observed message by checking for newly enabled messages.
 
-        1. Cycle through all registered schema tuples
+        1. Cycle through the registered schema tuples the message can affect
         2. Check if all messages in tuple are enabled
         3. If so, invoke the handlers in sequence
         4. Continue until a message is returned
@@ -327,8 +496,13 @@ class Adapter:
 
         Note: sending a message triggers the loop again
         """
-        for tup in self.generators.keys():
-            for group in zip(*(schema.match(message) for schema in tup)):
+        # match each schema once, however many tuples it appears in
+        matches = {}
+        for tup in self.generators_for(message.schema):
+            for schema in tup:
+                if schema not in matches:
+                    matches[schema] = schema.match(message)
+            for group in zip(*(matches[schema] for schema in tup)):
                 for handler in self.generators[tup]:
                     partials = [m.partial() for m in group]
                     # assume it returns only one message for now
@@ -364,63 +538,77 @@ class Adapter:
                     m.bind("price", 10)
                     return m
         """
-        fn = identity
+        # conditions on the triggering event; the first indexes the handler
+        # in the dispatch table, and the rest are checked on dispatch
+        conditions = []
+        if received != None:
+            conditions.append(("received", received))
+        if sent != None:
+            conditions.append(("sent", sent))
         if event != None:
             if isinstance(event, str):
-                prev = fn
-                fn = lambda e: (prev(e) and (hasattr(e, "type") and e.type == event))
-            elif issubclass(event, Event):
-                prev = fn
-                fn = lambda e: (prev(e) and isinstance(e, event))
+                conditions.append(("type", event))
             elif isinstance(event, bspl.protocol.Message):
-                schema = event
-                prev = fn
-                fn = lambda e: (
-                    prev(e)
-                    and isinstance(e, ObservationEvent)
-                    and any(m.schema == event for m in e.messages)
-                )
-        if received != None:
-            schema = received
-            prev = fn
-            fn = lambda e: (
-                prev(e)
-                and isinstance(e, ReceptionEvent)
-                and any(m.schema == event for m in e.messages)
-            )
-        if sent != None:
-            schema = sent
-            prev = fn
-            fn = lambda e: (
-                prev(e)
-                and isinstance(e, EmissionEvent)
-                and any(m.schema == event for m in e.messages)
-            )
-        if filter != None:
-            prev = fn
-            fn = lambda e: (prev(e) and filter(e))
-
-        if kwargs:
-
-            def match(event):
-                for k in kwargs:
-                    if k in event:
-                        return event[k] == kwargs[k]
-
-            prev = fn
-            fn = lambda e: (prev(e) and match(e))
+                conditions.insert(0, ("schema", event))
+            elif issubclass(event, Event):
+                conditions.append(("class", event))
+        key = conditions[0] if conditions else ("any",)
 
         def register(handler):
-            if fn not in self.decision_handlers:
-                self.decision_handlers[fn] = {handler}
-            else:
-                self.decision_handlers[fn].add(handler)
+            # resolve the handler's arity once, instead of on every event
+            arity = len(inspect.signature(handler).parameters)
+            entry = (
+                next(self.decision_order),
+                handler,
+                arity,
+                tuple(conditions[1:]),
+                filter,
+                kwargs,
+            )
+            self.decision_handlers.setdefault(key, []).append(entry)
+            return handler
 
         if handler != None:
-            register(handler)
+            return register(handler)
         else:
             return register
 
+    def dispatch(self, trigger):
+        """Yield the decision handler entries that may fire for an event, in registration order"""
+        keys = [("any",)]
+        if getattr(trigger, "type", None):
+            keys.append(("type", trigger.type))
+        keys.extend(("class", c) for c in type(trigger).__mro__)
+        if isinstance(trigger, ObservationEvent):
+            if isinstance(trigger, ReceptionEvent):
+                kind = "received"
+            elif isinstance(trigger, EmissionEvent):
+                kind = "sent"
+            else:
+                kind = None
+            for schema in {m.schema for m in trigger.messages}:
+                keys.append(("schema", schema))
+                if kind:
+                    keys.append((kind, schema))
+        entries = [e for k in keys for e in self.decision_handlers.get(k, ())]
+        entries.sort(key=lambda e: e[0])
+        return entries
+
+    @staticmethod
+    def satisfies(trigger, condition):
+        kind, value = condition
+        if kind == "type":
+            return getattr(trigger, "type", None) == value
+        if kind == "class":
+            return isinstance(trigger, value)
+        if kind == "received" and not isinstance(trigger, ReceptionEvent):
+            return False
+        if kind == "sent" and not isinstance(trigger, EmissionEvent):
+            return False
+        return isinstance(trigger, ObservationEvent) and any(
+            m.schema == value for m in trigger.messages
+        )
+
     def add_policies(self, *ps, when=None):
         s = None
         if when:
@@ -447,7 +635,17 @@ class Adapter:
             spec = yaml.full_load(file)
             self.load_policies(spec)
 
-    def start(self, *tasks, use_uvloop=True):
+    def start(self, *tasks, use_uvloop=True, shards=None):
+        """
+        Run the adapter until interrupted.
+
+        tasks: coroutines to run alongside the adapter
+        use_uvloop: use uvloop's event loop when it is available
+        shards: number of worker processes to spread enactments across; see bspl.adapter.sharding
+        """
+        if shards and shards > 1 and not self.shard:
+            return sharding.run(self, tasks, shards, use_uvloop=use_uvloop)
+
         if use_uvloop:
             try:
                 import uvloop
@@ -455,7 +653,6 @@ class Adapter:
                 use_uvloop = False
 
         async def main():
-            self.events = Queue()
             loop = asyncio.get_running_loop()
             loop.create_task(self.update_loop())
 
@@ -469,7 +666,15 @@ class Adapter:
                 # todo: add stop event support
                 loop.create_task(s.task(self))
 
-            await self.signal(InitEvent())
+            retention = getattr(self.history, "retention", None)
+            if retention:
+                loop.create_task(retention.task(self.history))
+
+            if self.shard and self.shard.index != 0:
+                # initiations are decided once, by the first shard
+                self.construct_initiators()
+            else:
+                await self.signal(InitEvent())
 
             for t in tasks:
                 loop.create_task(t)
@@ -478,6 +683,9 @@ class Adapter:
         aiorun.run(main(), stop_on_unhandled_errors=True, use_uvloop=use_uvloop)
 
     async def stop(self):
+        if self.lanes:
+            await self.lanes.join()
+        self.history.commit()
         await self.receiver.stop()
         await self.emitter.stop()
         self.running = False
@@ -487,14 +695,29 @@ class Adapter:
         Publish an event for triggering the update loop
         """
         if not hasattr(self, "events"):
-            self.events = Queue()
+            self.events = EventQueue()
         if isinstance(event, str):
             event = Event(event)
         await self.events.put(event)
 
     async def update(self):
         event = await self.events.get()
-        emissions = await self.process(event)
+        if not self.coalesce:
+            emissions = await self.process(event)
+        else:
+            events = [event]
+            while not self.events.empty():
+                events.append(self.events.get_nowait())
+            emissions = []
+            # observations are processed together, other events in turn
+            for observed, group in itertools.groupby(
+                events, lambda e: isinstance(e, ObservationEvent)
+            ):
+                if observed:
+                    emissions.extend(await self.process_observations(list(group)))
+                else:
+                    for e in group:
+                        emissions.extend(await self.process(e))
         if emissions:
             await self.send(*emissions)
 
@@ -516,12 +739,21 @@ class Adapter:
         Events need a specific structure;
         """
 
-        emissions = []
-
         if isinstance(event, ObservationEvent):
-            # Update the enabled messages if there was an emission or reception
-            observations = event.messages
-            for m in observations:
+            return await self.process_observations([event])
+        elif isinstance(event, InitEvent):
+            self.construct_initiators()
+        return await self.decide([event], event)
+
+    async def process_observations(self, events):
+        """
+        Process observation events as one step: react to each observation,
+        then update the enabled set and run the decision handlers once for all
+        of them, triggered by one merged event per kind of observation
+        """
+        observations = []
+        for event in events:
+            for m in event.messages:
                 self.debug(f"observing: {m}")
                 if "trace" in self.kwargs:
                     # if tracing is enabled, log the observation
@@ -534,38 +766,51 @@ class Adapter:
                     # wake up bdi logic
                     self.environment.wake_signal.set()
                 await self.react(m)
-                await self.handle_enabled(m)
-            event = self.compute_enabled(observations)
-        elif isinstance(event, InitEvent):
-            self.construct_initiators()
-
-        for fn in self.decision_handlers:
-            if fn(event):
-                for d in self.decision_handlers[fn]:
-                    s = inspect.signature(d).parameters
-                    result = None
-                    if len(s) == 1:
-                        result = await d(self.enabled_messages)
-                    elif len(s) == 2:
-                        result = await d(self.enabled_messages, event)
+                if self.lanes:
+                    # after the enactment's reactors, like them
+                    keys = (enactment(self.systems, m),)
+                    await self.lanes.submit(keys, self.handle_enabled, m)
+                else:
+                    await self.handle_enabled(m)
+            observations.extend(event.messages)
+        # handlers are selected by the original events, but observations are
+        # passed to them as the resulting changes to the enabled set
+        return await self.decide(merge(events), self.compute_enabled(observations))
+
+    async def decide(self, triggers, event):
+        """
+        Run the decision handlers for the triggering events, each at most
+        once, and return their emissions
 
-                    if self._in_place:
-                        instances = []
-                        for m in self.enabled_messages.messages():
-                            if m.instances:
-                                instances.extend(m.instances)
-                                m.instances.clear()
-                        emissions.extend(instances)
-                    elif result:
-                        # Handle both single messages and lists/collections
-                        if (
-                            hasattr(result, "__iter__")
-                            and not isinstance(result, (str, dict))
-                            and not hasattr(result, "schema")
-                        ):
-                            emissions.extend(result)
-                        else:
-                            emissions.append(result)
+        event: what the handlers are passed; the enabled set update for observations
+        """
+        emissions = []
+        entries = {}
+        for trigger in triggers:
+            for entry in self.dispatch(trigger):
+                if entry[0] not in entries and all(
+                    self.satisfies(trigger, c) for c in entry[3]
+                ):
+                    entries[entry[0]] = entry
+
+        if self.lanes:
+            # decisions wait for the handlers of every enactment they observe
+            keys = {
+                enactment(self.systems, m)
+                for t in triggers
+                for m in getattr(t, "messages", ())
+            } or {None}
+
+        for order in sorted(entries):
+            _, d, arity, _, filter, kwargs = entries[order]
+            if filter != None and not filter(event):
+                continue
+            if kwargs and not match_fields(event, kwargs):
+                continue
+            if self.lanes:
+                await self.lanes.submit(keys, self.decide_and_send, d, arity, event)
+            else:
+                emissions.extend(await self.run_decision(d, arity, event))
 
         if hasattr(self, "bdi"):
             emissions.extend(
@@ -574,6 +819,38 @@ class Adapter:
             self.environment.wake_signal.set()
         return emissions
 
+    async def run_decision(self, d, arity, event):
+        """Run a decision handler and return the messages it decided to send"""
+        result = None
+        if arity == 1:
+            result = await d(self.enabled_messages)
+        elif arity == 2:
+            result = await d(self.enabled_messages, event)
+
+        if self._in_place:
+            instances = []
+            for m in self.enabled_messages.messages():
+                if m.instances:
+                    instances.extend(m.instances)
+                    m.instances.clear()
+            return instances
+        elif result:
+            # Handle both single messages and lists/collections
+            if (
+                hasattr(result, "__iter__")
+                and not isinstance(result, (str, dict))
+                and not hasattr(result, "schema")
+            ):
+                return list(result)
+            else:
+                return [result]
+        return []
+
+    async def decide_and_send(self, d, arity, event):
+        emissions = await self.run_decision(d, arity, event)
+        if emissions:
+            await self.send(*emissions)
+
     def construct_initiators(self):
         # Add initioators
         for sID, s in self.systems.items():
@@ -587,18 +864,16 @@ class Adapter:
         """
         Compute updates to the enabled set based on a list of an observations
         """
-        # clear out matching keys from enabled set
+        # clear out affected schemas under matching keys from enabled set
         removed = set()
         for msg in observations:
-            context = self.enabled_messages.context(msg)
-            removed.update(context.messages())
-            context.clear()
+            context = self.enabled_messages.lookup(msg)
+            removed.update(context.remove(*self.dependents.get(msg.schema, ())))
 
         added = set()
         for o in observations:
-            for schema in self.systems[o.system]["protocol"].messages.values():
-                if schema.sender in self.roles:
-                    added.update(schema.match(o))
+            for schema in self.dependents.get(o.schema, ()):
+                added.update(schema.match(o))
         for m in added:
             self.debug(f"new enabled message: {m}")
             self.enabled_messages.add(m.partial())
@@ -2,12 +2,20 @@ import asyncio
 import logging
 import socket
 import json
+import os
+import struct
 from asyncio.queues import Queue
+from collections import deque
+from .message import is_path
 
 logger = logging.getLogger("bspl.emitter")
 
 
 def encode(msg):
+    # use the schema's specialized encoder, if the adapter has installed one
+    encoder = getattr(msg.schema, "encoder", None)
+    if encoder is not None:
+        return encoder(msg)
     s = json.dumps(
         msg.serialize(),
         separators=(",", ":"),
@@ -16,18 +24,160 @@ def encode(msg):
     return b
 
 
+def encode_all(encode, messages):
+    """
+    Yield each message with its encoding, encoding the copies of a message
+    fanned out to several recipients only once.
+
+    Copies share their payload object, which identifies them.
+    """
+    encoded = {}
+    for m in messages:
+        key = (id(m.payload), m.schema, m.system)
+        data = encoded.get(key)
+        if data is None:
+            data = encoded[key] = encode(m)
+        yield m, data
+
+
+class DatagramSender(asyncio.DatagramProtocol):
+    """
+    Nonblocking datagram sends, for the datagram emitters.
+
+    Once started, packets go through an asyncio DatagramTransport, which
+    pauses the sender when its buffer passes the high watermark and resumes
+    it below the low one.  While paused, packets wait in a bounded queue per
+    destination and are sent in order on resume; packets beyond the bound
+    are dropped.  Before the transport is started, packets are sent
+    directly on the nonblocking socket and deferred if it would block.  If
+    the transport is lost, e.g. after a fatal send error, the sender falls
+    back to a fresh socket and starts a new transport on it.
+
+    Packets for a destination of the other address family are dropped
+    before they reach the transport, which would otherwise fail and close.
+
+    Counts deferred and dropped packets in the owning emitter's stats.
+    """
+
+    def __init__(self, stats, family=socket.AF_INET, high=2**16, low=None, overflow=1000):
+        """
+        stats: the emitter's statistics dictionary
+        family: socket address family
+        high: transport buffer size in bytes at which to pause sending
+        low: transport buffer size in bytes at which to resume sending
+        overflow: maximum number of packets to queue per destination while paused
+        """
+        self.stats = stats
+        self.stats.update(deferred=0, dropped=0)
+        self.high = high
+        self.low = low
+        self.limit = overflow
+        self.family = family
+        self.socket = socket.socket(family, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        self.transport = None
+        self.paused = False
+        self.closed = False
+        self.backlog = {}  # dest -> deque of packets
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.transport, _ = await loop.create_datagram_endpoint(
+            lambda: self, sock=self.socket
+        )
+        self.transport.set_write_buffer_limits(self.high, self.low)
+        self.flush()
+
+    def connection_lost(self, exc):
+        self.transport = None
+        self.paused = False
+        if self.closed:
+            return
+        logger.warning(f"Lost datagram transport: {exc}")
+        self.stats["dropped"] += 1
+        self.socket = socket.socket(self.family, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        asyncio.get_running_loop().create_task(self.start())
+
+    def pause_writing(self):
+        self.paused = True
+
+    def resume_writing(self):
+        self.paused = False
+        self.flush()
+
+    def error_received(self, exc):
+        logger.warning(f"Failed to send packet: {exc}")
+        self.stats["dropped"] += 1
+
+    def sendto(self, packet, dest):
+        """Send or queue packet; return False if it was dropped"""
+        if is_path(dest) != (self.family == socket.AF_UNIX):
+            logger.warning(f"Cannot send packet to {dest} over {self.family.name}")
+            self.stats["dropped"] += 1
+            return False
+        if self.paused or self.backlog.get(dest):
+            # keep the order of packets to each destination
+            return self.defer(packet, dest)
+        if self.transport is not None:
+            self.transport.sendto(packet, dest)
+            return True
+        try:
+            self.socket.sendto(packet, dest)
+        except BlockingIOError:
+            return self.defer(packet, dest)
+        except OSError as e:
+            logger.warning(f"Failed to send packet to {dest}: {e}")
+            self.stats["dropped"] += 1
+            return False
+        return True
+
+    def defer(self, packet, dest):
+        queue = self.backlog.setdefault(dest, deque())
+        if len(queue) >= self.limit:
+            self.stats["dropped"] += 1
+            return False
+        queue.append(packet)
+        self.stats["deferred"] += 1
+        return True
+
+    def flush(self):
+        """Send queued packets, one destination at a time in turn, until paused or done"""
+        if self.transport is None:
+            return
+        while self.backlog and not self.paused:
+            for dest in list(self.backlog):
+                queue = self.backlog[dest]
+                self.transport.sendto(queue.popleft(), dest)
+                if not queue:
+                    del self.backlog[dest]
+                if self.paused:
+                    break
+
+    def close(self):
+        self.closed = True
+        if self.transport is not None:
+            self.transport.close()
+        else:
+            self.socket.close()
+
+
 class Emitter:
     """An Emitter just needs one method: send(message)."""
 
-    def __init__(self, encoder=encode, mtu=1500 - 48):
-        """Each component is a function that"""
+    def __init__(self, encoder=encode, mtu=1500 - 48, **flow):
+        """
+        encoder: function encoding a message as bytes
+        mtu: maximum packet size
+        flow: high, low and overflow limits for the DatagramSender
+        """
         self.encode = encoder
         self.mtu = mtu
-
-        self.socket = socket.socket(
-            socket.AF_INET, socket.SOCK_DGRAM  # Internet
-        )  # UDP
         self.stats = {"bytes": 0, "packets": 0}
+        self.sender = DatagramSender(self.stats, **flow)
+
+    async def task(self):
+        await self.sender.start()
 
     async def send(self, message):
         """Send bun via UDP"""
@@ -36,8 +186,7 @@ class Emitter:
 
     async def bulk_send(self, messages):
         packets = {}
-        for m in messages:
-            data = self.encode(m)
+        for m, data in encode_all(self.encode, messages):
             if m.dest in packets:
                 if len(packets[m.dest]) + len(data) + 3 > self.mtu:
                     if len(packets[m.dest]) + 2 > self.mtu:
@@ -58,14 +207,61 @@ class Emitter:
         for dest in packets:
             self.transmit(b"[" + packets[dest] + b"]", dest)
 
+    def route(self, dest):
+        """The sender for dest, and dest in the form it expects"""
+        return self.sender, dest
+
     def transmit(self, packet, dest):
         logger.debug("Sending packet {} to {}".format(packet, dest))
-        self.stats["bytes"] += len(packet)
-        self.stats["packets"] += 1
-        self.socket.sendto(packet, dest)
+        sender, dest = self.route(dest)
+        if sender.sendto(packet, dest):
+            self.stats["bytes"] += len(packet)
+            self.stats["packets"] += 1
+
+    async def stop(self):
+        self.sender.close()
+
+
+class UnixEmitter(Emitter):
+    """
+    Emitter for co-located agents, sending datagrams over Unix domain sockets.
+
+    Destinations are socket paths, as bound by UnixReceiver.  Local
+    datagrams skip the IP stack and are not limited by the network MTU.
+    """
+
+    def __init__(self, encoder=encode, mtu=2**16, **flow):
+        super().__init__(encoder, mtu, family=socket.AF_UNIX, **flow)
+
+    def route(self, dest):
+        return self.sender, os.fspath(dest)
+
+
+class MixedEmitter(Emitter):
+    """
+    Emitter for agents reached both over UDP and over Unix domain sockets.
+
+    Each packet goes through a UDP or a Unix datagram socket, depending on
+    whether its destination is a (host, port) pair or a socket path.  Packets
+    are packed to the UDP mtu for either kind of destination.
+    """
+
+    def __init__(self, encoder=encode, mtu=1500 - 48, **flow):
+        super().__init__(encoder, mtu, **flow)
+        self.unix = DatagramSender(self.stats, family=socket.AF_UNIX, **flow)
+
+    async def task(self):
+        await super().task()
+        await self.unix.start()
+
+    def route(self, dest):
+        if is_path(dest):
+            return self.unix, os.fspath(dest)
+        return self.sender, dest
 
     async def stop(self):
-        self.socket.close()
+        await super().stop()
+        self.unix.close()
 
 
 class MockEmitter:
@@ -93,8 +289,7 @@ class MockEmitter:
     async def bulk_send(self, messages):
         """Track multiple messages without any network operations"""
         self.sent_messages.extend(messages)
-        for message in messages:
-            packet = self.encode(message)
+        for message, packet in encode_all(self.encode, messages):
             logger.debug(f"Mock emitter recording: {message} to {message.dest}")
             self.stats["bytes"] += len(packet)
             self.stats["packets"] += 1
@@ -108,7 +303,12 @@ class MockEmitter:
 class Bundle:
     def __init__(self, max_size):
         self.max_size = max_size
-        self.contents = b""
+        self.parts = []
+        self.size = 0  # length of contents
+
+    @property
+    def contents(self):
+        return b",".join(self.parts)
 
     def add(self, message):
         """
@@ -117,13 +317,15 @@ class Bundle:
         if type(message) is str:
             message = bytes(message, "utf-8")
 
-        if len(self.contents) > 0:
-            self.contents += b"," + message
-        else:
-            self.contents = message
+        if self.parts:
+            self.size += 1
+        self.parts.append(message)
+        self.size += len(message)
 
     def test(self, message):
-        if len(self.contents) + len(message) + 2 <= self.max_size:
+        # brackets, and a separator unless it is the first message
+        separator = 1 if self.parts else 0
+        if self.size + separator + len(message) + 2 <= self.max_size:
             return True
         return False
 
@@ -132,7 +334,7 @@ class Bundle:
             if self.test(deque[0]):
                 self.add(deque.popleft())
             else:
-                if self.contents:
+                if self.parts:
                     break
                 else:
                     raise Exception(
@@ -141,7 +343,7 @@ class Bundle:
                         )
                     )
 
-        return b"[" + self.contents + b"]"
+        return b"[" + b",".join(self.parts) + b"]"
 
 
 def bundle(mtu, queue):
@@ -149,63 +351,112 @@ def bundle(mtu, queue):
     return b.pack(queue)
 
 
+class Channel:
+    """Encoded messages waiting to be bundled for one destination"""
+
+    def __init__(self):
+        self.messages = deque()
+        self.size = 2  # bytes needed to send everything queued, with brackets and separators
+        self.timer = None
+
+
 class BundlingEmitter:
-    """An Emitter just needs the send(message) method."""
+    """
+    Emitter that bundles messages for the same destination into datagrams.
 
-    def __init__(self, encoder=encode, bundler=bundle, mtu=1500 - 48):
-        """Each component is a function that"""
+    A destination's bundle is flushed as soon as it would fill a packet, or
+    once delay seconds have passed since its first queued message.  With the
+    default delay of 0, messages sent in the same event loop iteration are
+    bundled together; a small delay such as 0.001 trades a bounded amount of
+    latency for fuller packets.
+    """
+
+    def __init__(
+        self, encoder=encode, bundler=bundle, mtu=1500 - 48, delay=0, **flow
+    ):
+        """
+        encoder: function encoding a message as bytes
+        bundler: function packing encoded messages from a deque into a packet
+        mtu: maximum packet size
+        delay: seconds to wait for more messages before sending a partial packet
+        flow: high, low and overflow limits for the DatagramSender
+        """
         self.encode = encoder
         self.bundle = bundler
         self.mtu = mtu
+        self.delay = delay
         self.running = False
 
         self.channels = {}
-        self.socket = socket.socket(
-            socket.AF_INET, socket.SOCK_DGRAM  # Internet
-        )  # UDP
-        self.stats = {"bytes": 0, "packets": 0}
-
-    async def sort(self):
-        while self.running:
-            message = await self.queue.get()
-            m = self.encode(message)
-            if message.dest in self.channels:
-                await self.channels[message.dest].put(m)
+        self.stats = {"bytes": 0, "packets": 0, "fill": 0.0}
+        self.sender = DatagramSender(self.stats, **flow)
+
+    def enqueue(self, message, data=None):
+        if data is None:
+            data = self.encode(message)
+        dest = message.dest
+        channel = self.channels.get(dest)
+        if channel is None:
+            channel = self.channels[dest] = Channel()
+        channel.messages.append(data)
+        channel.size += len(data) + (1 if len(channel.messages) > 1 else 0)
+        if channel.size >= self.mtu:
+            # send full packets right away, keeping the remainder for the next one
+            while channel.size >= self.mtu:
+                self.transmit(self.pack(channel), dest)
+        if channel.messages and channel.timer is None:
+            loop = asyncio.get_running_loop()
+            if self.delay:
+                channel.timer = loop.call_later(self.delay, self.flush, dest)
             else:
-                loop = asyncio.get_running_loop()
-                queue = self.channels[message.dest] = Queue()
-                loop.create_task(self.process(message.dest, queue))
-                await self.channels[message.dest].put(m)
+                channel.timer = loop.call_soon(self.flush, dest)
 
-    async def process(self, dest, queue):
-        while self.running:
-            message = await queue.get()
-            q = queue._queue
-            q.appendleft(message)
-            packet = self.bundle(self.mtu, q)
-            self.transmit(packet, dest)
+    def pack(self, channel):
+        packet = self.bundle(self.mtu, channel.messages)
+        if channel.messages:
+            channel.size = 1 + sum(len(m) + 1 for m in channel.messages)
+        else:
+            channel.size = 2
+        return packet
+
+    def flush(self, dest):
+        """Send everything queued for dest"""
+        channel = self.channels[dest]
+        if channel.timer is not None:
+            channel.timer.cancel()
+            channel.timer = None
+        while channel.messages:
+            self.transmit(self.pack(channel), dest)
 
     async def task(self):
-        """Start loop for transmitting messages in outgoing queue"""
-        loop = asyncio.get_running_loop()
-        self.queue = Queue()
+        """Start accepting messages for transmission"""
+        await self.sender.start()
         self.running = True
-        loop.create_task(self.sort())
 
     async def send(self, message):
-        # Do mangling and encoding first; then bundler can process the queue directly
-        await self.queue.put(message)
+        self.enqueue(message)
+
+    async def bulk_send(self, messages):
+        for m, data in encode_all(self.encode, messages):
+            self.enqueue(m, data)
 
     def transmit(self, packet, dest):
         """Send binary-encoded bun via UDP"""
         logger.debug("Sending packet {} to {}".format(packet, dest))
+        if not self.sender.sendto(packet, dest):
+            return
         self.stats["bytes"] += len(packet)
         self.stats["packets"] += 1
-        self.socket.sendto(packet, dest)
+        # running mean of how full each packet is
+        self.stats["fill"] += (len(packet) / self.mtu - self.stats["fill"]) / self.stats[
+            "packets"
+        ]
 
     async def stop(self):
+        for dest in list(self.channels):
+            self.flush(dest)
         self.running = False
-        self.socket.close()
+        self.sender.close()
 
 
 class TCPEmitter:
@@ -251,3 +502,107 @@ class TCPEmitter:
         for writer in self.channels.values():
             writer.close()
             await writer.wait_closed()
+
+
+header = struct.Struct(">I")
+
+
+class StreamEmitter:
+    """
+    Emitter for TCP streams of length-prefixed frames, one message per frame.
+
+    Each destination gets a bounded queue and a writer task that batches
+    whatever is queued into a single writelines call and waits for the
+    transport to drain before writing more.  When a peer falls behind, its
+    queue fills up and send blocks, pushing back on the adapter instead of
+    buffering without limit.  Lost connections are retried with exponential
+    backoff, and the batch being written when the connection failed is
+    resent.
+    """
+
+    def __init__(
+        self, encoder=encode, limit=10000, batch=1000, backoff=0.1, max_backoff=10
+    ):
+        """
+        encoder: function encoding a message as bytes
+        limit: maximum number of frames queued per destination
+        batch: maximum number of frames written per drain
+        backoff: initial seconds to wait before reconnecting
+        max_backoff: maximum seconds to wait before reconnecting
+        """
+        self.encode = encoder
+        self.limit = limit
+        self.batch = batch
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.queues = {}
+        self.tasks = []
+        self.running = False
+        self.stats = {"bytes": 0, "packets": 0, "reconnects": 0}
+
+    async def connect(self, dest):
+        return await asyncio.open_connection(*dest)
+
+    async def write(self, dest, queue):
+        backoff = self.backoff
+        frames = []
+        while self.running:
+            try:
+                _, writer = await self.connect(dest)
+            except OSError as e:
+                logger.warning(f"Could not connect to {dest}: {e}; retrying in {backoff}s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                self.stats["reconnects"] += 1
+                continue
+            backoff = self.backoff
+            try:
+                while self.running:
+                    if not frames:
+                        frames.append(await queue.get())
+                        while len(frames) < self.batch and not queue.empty():
+                            frames.append(queue.get_nowait())
+                    writer.writelines(frames)
+                    await writer.drain()
+                    self.stats["bytes"] += sum(len(f) for f in frames)
+                    self.stats["packets"] += len(frames)
+                    frames = []
+            except OSError as e:
+                logger.warning(f"Lost connection to {dest}: {e}")
+            finally:
+                writer.close()
+
+    def frame(self, message):
+        data = self.encode(message)
+        return header.pack(len(data)) + data
+
+    def channel(self, dest):
+        queue = self.queues.get(dest)
+        if queue is None:
+            queue = self.queues[dest] = Queue(self.limit)
+            loop = asyncio.get_running_loop()
+            self.tasks.append(loop.create_task(self.write(dest, queue)))
+        return queue
+
+    async def send(self, message):
+        await self.channel(message.dest).put(self.frame(message))
+
+    async def bulk_send(self, messages):
+        for m, data in encode_all(self.frame, messages):
+            await self.channel(m.dest).put(data)
+
+    async def task(self):
+        self.running = True
+
+    async def stop(self):
+        self.running = False
+        for t in self.tasks:
+            t.cancel()
+        self.tasks.clear()
+
+
+class UnixStreamEmitter(StreamEmitter):
+    """StreamEmitter for co-located agents, connecting to Unix domain socket paths"""
+
+    async def connect(self, dest):
+        return await asyncio.open_unix_connection(os.fspath(dest))
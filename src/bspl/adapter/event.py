@@ -13,9 +13,9 @@ class ObservationEvent(Event):
 
 
 class ReceptionEvent(ObservationEvent):
-    def __init__(self, message):
+    def __init__(self, *messages):
         self.type = "reception"
-        self.messages = [message]
+        self.messages = list(messages)
 
 
 class EmissionEvent(ObservationEvent):
@@ -0,0 +1,89 @@
+"""
+Concurrent execution of reactors and decision handlers.
+
+By default the update loop awaits each handler in turn, so one slow handler
+(e.g. a database write) holds up every enactment.  With Lanes, each handler,
+including the enabled-message generators run for each observation, runs as
+its own task instead.  Handlers for the same enactment still run one
+after another, in the order they were submitted, so each enactment sees its
+messages in the same order as before; handlers for different enactments
+overlap.  An enactment is identified by the value of the outermost protocol
+key its message binds, as for sharding.
+
+At most limit handlers are in flight at once; beyond that, submitting a
+handler waits, which holds up the update loop until one finishes.
+
+Example:
+  Adapter(name, systems, agents, concurrency=100)
+"""
+
+import asyncio
+import logging
+from .sharding import root_key
+
+logger = logging.getLogger("bspl.lanes")
+
+
+def enactment(systems, message):
+    """Identify the enactment of message, or None if it binds no protocol key"""
+    protocol = systems[message.system]["protocol"]
+    k = root_key(protocol, message.schema)
+    if k is None:
+        return None
+    return (message.system, message.payload.get(k))
+
+
+class Lanes:
+    def __init__(self, limit=100):
+        """
+        limit: maximum number of handlers in flight, including those waiting
+          for earlier handlers of their enactments
+        """
+        self.limit = limit
+        self.slots = None  # created on the running loop
+        self.lanes = {}  # key -> task of the last handler submitted for it
+        self.stats = {"tasks": 0, "in flight": 0, "max in flight": 0, "errors": 0}
+
+    async def submit(self, keys, handler, *args):
+        """
+        Run handler(*args) in a task after the handlers already submitted for
+        any of keys; waits while limit handlers are in flight
+        """
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.limit)
+        await self.slots.acquire()
+        previous = {self.lanes[k] for k in keys if k in self.lanes}
+        task = asyncio.get_running_loop().create_task(
+            self.run(previous, handler, args)
+        )
+        for k in keys:
+            self.lanes[k] = task
+        task.add_done_callback(lambda t: self.done(keys, t))
+        self.stats["tasks"] += 1
+        self.stats["in flight"] += 1
+        self.stats["max in flight"] = max(
+            self.stats["max in flight"], self.stats["in flight"]
+        )
+        return task
+
+    async def run(self, previous, handler, args):
+        if previous:
+            # handlers log their own errors, so just wait for them to finish
+            await asyncio.wait(previous)
+        try:
+            await handler(*args)
+        except Exception:
+            self.stats["errors"] += 1
+            logger.exception(f"Error in handler {handler}")
+
+    def done(self, keys, task):
+        self.slots.release()
+        self.stats["in flight"] -= 1
+        for k in keys:
+            if self.lanes.get(k) is task:
+                del self.lanes[k]
+
+    async def join(self):
+        """Wait for every submitted handler to finish"""
+        while self.lanes:
+            await asyncio.wait(set(self.lanes.values()))
@@ -0,0 +1,96 @@
+"""
+In-process transport for adapters running in the same Python process.
+
+Messages are handed from the sending adapter to the receiving adapter's
+queue as Message objects, without encoding, sockets or decoding.  The
+receiver gets its own Message, of its own schema; when both adapters use the
+same parsed protocol it shares the sender's payload, since payloads are never
+modified once sent, and only the meta is separate.
+
+Example:
+  network = {}
+  Adapter("C", systems, agents, emitter=LoopbackEmitter(network),
+          receiver=LoopbackReceiver(agents["C"][0], network))
+"""
+
+import asyncio
+import logging
+from asyncio.queues import Queue
+from .message import Message
+
+logger = logging.getLogger("bspl.loopback")
+
+# endpoint -> LoopbackReceiver, used when no network is given
+network = {}
+
+
+class LoopbackEmitter:
+    def __init__(self, network=network):
+        """
+        network: dictionary of receivers by endpoint, shared with the LoopbackReceivers
+        """
+        self.network = network
+        self.stats = {"bytes": 0, "packets": 0, "dropped": 0}
+
+    def deliver(self, message):
+        receiver = self.network.get(message.dest)
+        if receiver is None or not receiver.listening:
+            logger.debug(f"No receiver at {message.dest}; dropped {message}")
+            self.stats["dropped"] += 1
+            return
+        # the receiving adapter may have parsed its own copy of the protocol,
+        # and dispatches on its own schema objects
+        schema = receiver.adapter.messages.get(message.schema.qualified_name)
+        if schema is None:
+            logger.warning(f"Receiver at {message.dest} does not know {message}")
+            self.stats["dropped"] += 1
+            return
+        payload = message.payload
+        if schema is not message.schema:
+            # the payload record belongs to the sender's schema
+            payload = dict(payload)
+        receiver.queue.put_nowait(
+            Message(schema, payload, meta=message._meta, system=message._system)
+        )
+        self.stats["packets"] += 1
+
+    async def send(self, message):
+        self.deliver(message)
+
+    async def bulk_send(self, messages):
+        for m in messages:
+            self.deliver(m)
+
+    async def stop(self):
+        pass
+
+
+class LoopbackReceiver:
+    def __init__(self, address, network=network):
+        """
+        address: the endpoint other adapters send to, as in the agents map
+        network: dictionary of receivers by endpoint, shared with the LoopbackEmitters
+        """
+        self.address = address
+        self.network = network
+        self.listening = False
+
+    async def task(self, adapter):
+        self.adapter = adapter
+        self.queue = Queue()
+        self.network[self.address] = self
+        self.listening = True
+        adapter.debug(f"Listening on loopback {self.address}")
+        asyncio.get_running_loop().create_task(self.process())
+
+    async def process(self):
+        while self.listening:
+            messages = [await self.queue.get()]
+            while not self.queue.empty():
+                messages.append(self.queue.get_nowait())
+            await self.adapter.receive_many(messages)
+
+    async def stop(self):
+        self.listening = False
+        if self.network.get(self.address) is self:
+            del self.network[self.address]
@@ -2,50 +2,187 @@
 
 import agentspeak
 from agentspeak import Literal, Var
+import os
 import re
+from collections.abc import MutableMapping
 from ..utils import camel_to_snake
 
 
+def is_path(endpoint):
+    """Whether endpoint is a filesystem path to a Unix domain socket, instead of a (host, port) pair"""
+    return isinstance(endpoint, (str, os.PathLike))
+
+
+def check_endpoint(endpoint):
+    if is_path(endpoint):
+        return
+    if not (isinstance(endpoint, tuple) and len(endpoint) == 2):
+        raise ValueError(
+            f"Invalid endpoint {endpoint}: must be (host, port) tuple or a socket path"
+        )
+    host, port = endpoint
+    if not isinstance(host, str) or not isinstance(port, int):
+        raise ValueError(
+            f"Invalid endpoint {endpoint}: host must be string, port must be int"
+        )
+
+
 def get_key(schema, payload):
     # schema.keys should be ordered, or sorted for consistency
     return ",".join(k + ":" + str(payload[k]) for k in schema.keys)
 
 
+class Record(MutableMapping):
+    """
+    Base class for the payload types generated for each message schema.
+
+    Parameter values are held in positional slots instead of a dict, and
+    unbound parameters are simply unset slots.  Otherwise a record behaves like
+    the dict it replaces.
+    """
+
+    __slots__ = ()
+    fields = ()  # parameter names, in schema order
+    slots = {}  # parameter name -> slot name
+    required = ()  # parameters that must be bound for the message to be complete
+
+    def __init__(self, payload=None):
+        if payload:
+            for k, v in payload.items():
+                setattr(self, self.slots[k], v)
+
+    def __getitem__(self, name):
+        try:
+            return getattr(self, self.slots[name])
+        except AttributeError:
+            raise KeyError(name) from None
+
+    def __setitem__(self, name, value):
+        setattr(self, self.slots[name], value)
+
+    def __delitem__(self, name):
+        try:
+            delattr(self, self.slots[name])
+        except AttributeError:
+            raise KeyError(name) from None
+
+    def __contains__(self, name):
+        slot = self.slots.get(name)
+        return slot is not None and hasattr(self, slot)
+
+    def __iter__(self):
+        for name, slot in self.slots.items():
+            if hasattr(self, slot):
+                yield name
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def get(self, name, default=None):
+        slot = self.slots.get(name)
+        if slot is None:
+            return default
+        return getattr(self, slot, default)
+
+    def copy(self):
+        return type(self)(self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+def record_class(schema):
+    """Generate a Record type with a slot for each parameter of schema"""
+    fields = tuple(schema.parameters)
+    slots = {p: f"_{i}" for i, p in enumerate(fields)}
+    return type(
+        f"{schema.name}Record",
+        (Record,),
+        {
+            "__slots__": tuple(slots.values()),
+            "fields": fields,
+            "slots": slots,
+            "required": tuple(schema.ins | schema.outs),
+        },
+    )
+
+
 class Message:
-    schema = None
-    payload = {}
-    acknowledged = False
-    _dest = None
-    _dests = None
-    adapter = None
-    meta = {}
-    key = None
+    # messages are held by the million, so avoid a __dict__ per instance
+    __slots__ = (
+        "schema",
+        "payload",
+        "acknowledged",
+        "_dest",
+        "_dests",
+        "adapter",
+        "_system",
+        "_meta",
+        "_key",
+        "_key_values",
+        "_hash",
+    )
 
     def __init__(
         self,
         schema,
         payload=None,
-        meta={},
+        meta=None,
         acknowledged=False,
         dest=None,
         adapter=None,
         system=None,
     ):
         self.schema = schema
-        self.payload = payload or {}
+        payload = payload or {}
+        record = getattr(schema, "record", None)
+        if record is not None and type(payload) is dict:
+            try:
+                payload = record(payload)
+            except KeyError:
+                pass  # not a payload of this schema; keep the dict
+        self.payload = payload
         self.acknowledged = acknowledged
         self._dest = dest  # Use private attribute for backwards compatibility
         self._dests = None  # Initialize multiple destinations
         self.adapter = adapter
-        self.meta = {"system": system, **meta}
+        self._system = system
+        # meta is only allocated once something besides the system is stored
+        self._meta = {"system": system, **meta} if meta else None
+        self._key = self._key_values = self._hash = None
+
+    @property
+    def meta(self):
+        if self._meta is None:
+            self._meta = {"system": self._system}
+        return self._meta
+
+    @meta.setter
+    def meta(self, value):
+        self._meta = value
+
+    def rekey(self):
+        """Forget the cached key and hash, after changing key parameters in the payload directly"""
+        self._key = self._key_values = self._hash = None
 
     @property
     def key(self):
-        return get_key(self.schema, self.payload)
+        if self._key is None:
+            self._key = get_key(self.schema, self.payload)
+        return self._key
+
+    @property
+    def key_values(self):
+        """Tuple of the values of the schema's key parameters"""
+        if self._key_values is None:
+            self._key_values = tuple(self.payload.get(k) for k in self.schema.keys)
+        return self._key_values
 
     @property
     def system(self):
-        return self.meta["system"]
+        if self._meta is None:
+            return self._system
+        return self._meta["system"]
 
     @property
     def recipients(self):
@@ -73,13 +210,9 @@ class Message:
         """Set multiple destination endpoints - clears dest"""
         if value is not None:
             if not isinstance(value, list):
-                raise ValueError("dests must be a list of (host, port) tuples")
+                raise ValueError("dests must be a list of (host, port) tuples or socket paths")
             for endpoint in value:
-                if not (isinstance(endpoint, tuple) and len(endpoint) == 2):
-                    raise ValueError(f"Invalid endpoint {endpoint}: must be (host, port) tuple")
-                host, port = endpoint
-                if not isinstance(host, str) or not isinstance(port, int):
-                    raise ValueError(f"Invalid endpoint {endpoint}: host must be string, port must be int")
+                check_endpoint(endpoint)
         self._dests = value
         self._dest = None  # Clear single dest when setting multiple
 
@@ -93,11 +226,7 @@ class Message:
     def dest(self, value):
         """Set single destination endpoint - clears dests"""
         if value is not None:
-            if not (isinstance(value, tuple) and len(value) == 2):
-                raise ValueError(f"Invalid endpoint {value}: must be (host, port) tuple")
-            host, port = value
-            if not isinstance(host, str) or not isinstance(port, int):
-                raise ValueError(f"Invalid endpoint {value}: host must be string, port must be int")
+            check_endpoint(value)
         self._dest = value
         self._dests = None  # Clear multiple dests when setting single
 
@@ -114,7 +243,9 @@ class Message:
         )
 
     def __hash__(self):
-        return hash(self.schema.qualified_name + self.key)
+        if self._hash is None:
+            self._hash = hash(self.schema.qualified_name + self.key)
+        return self._hash
 
     def __getitem__(self, name):
         return self.payload[name]
@@ -122,9 +253,12 @@ class Message:
     def __setitem__(self, name, value):
         if name not in self.schema.parameters:
             raise Exception(f"Parameter {name} is not in schema {self.schema}")
-        adornment = self.schema.parameters[name].adornment
+        parameter = self.schema.parameters[name]
+        adornment = parameter.adornment
         if adornment == "out":
             self.payload[name] = value
+            if parameter.key:
+                self.rekey()
             return value
         else:
             raise Exception(f"Parameter {name} is {adornment}, not out")
@@ -163,7 +297,7 @@ class Message:
         self.adapter.send(self)
 
     def context(self, schema=None):
-        return self.adapter.history.context(self, schema)
+        return self.adapter.history.lookup(self, schema)
 
     def term(self):
         functor = camel_to_snake(self.schema.name)
@@ -214,27 +348,37 @@ class Message:
     @property
     def complete(self):
         # payload must contain something other than None for all ins and outs
-        return all(
-            self.payload.get(k) != None for k in self.schema.ins.union(self.schema.outs)
-        )
+        payload = self.payload
+        if isinstance(payload, Record):
+            required = payload.required
+        else:
+            required = self.schema.ins.union(self.schema.outs)
+        return all(payload.get(k) != None for k in required)
 
     def partial(self):
         return Partial(self)
 
     def serialize(self):
-        return {"schema": self.schema.qualified_name, "payload": self.payload, "meta": self.meta}
+        meta = self._meta if self._meta is not None else {"system": self._system}
+        payload = self.payload if type(self.payload) is dict else dict(self.payload)
+        return {"schema": self.schema.qualified_name, "payload": payload, "meta": meta}
 
 
 class Partial(Message):
+    __slots__ = ("bindings", "instances")
+
     def __init__(self, message):
-        self.schema = message.schema
-        self.adapter = message.adapter
+        super().__init__(
+            message.schema,
+            message.payload.copy(),
+            meta=message._meta,
+            adapter=message.adapter,
+            system=message._system,
+        )
         # the base bindings that are used to initialize each instance
-        self.bindings = self.payload = message.payload.copy()
-        self._dest = None
+        self.bindings = self.payload
 
         self.instances = []
-        self.meta = message.meta.copy()
 
     def bind(self, **kwargs):
         inst = Message(
@@ -0,0 +1,149 @@
+"""
+Bounded event queue for the adapter's update loop.
+
+The queue is overloaded once limit observation events are pending.  Over the
+limit, the "block" policy makes the receivers wait for the queue to drain,
+which pushes back on the network; the datagram receivers' own queues are
+bounded too, so datagrams beyond their limit are dropped rather than piling
+up in front of the adapter, and the sharding router likewise drops inbound
+messages for a worker that falls too far behind.  The "shed" policy keeps admitting new
+messages, shedding only redundant traffic, until ceiling events are pending;
+beyond that it drops new messages too, before they are added to the history,
+so their senders can deliver them again later.  Emissions are always
+admitted, since they are queued by the update loop itself and are already in
+the history.
+
+Redundant traffic is shed first under either policy: duplicates, including
+the peers' reminders, are always dropped on reception, and while the queue is
+overloaded, schedulers skip their own reminder policies.  Other events, such
+as the InitEvent that constructs the initiators, wait until the pending
+observations have been processed.
+
+Example:
+  Adapter(name, systems, agents, events=EventQueue(limit=10000, policy="shed"))
+"""
+
+import time
+import asyncio
+import logging
+from collections import deque
+from .event import ObservationEvent
+
+logger = logging.getLogger("bspl.overload")
+
+
+class EventQueue:
+    def __init__(self, limit=None, policy="block", ceiling=None):
+        """
+        limit: number of pending observation events at which the queue is overloaded; None for no limit
+        policy: "block" to wait for room for inbound messages, or "shed" to drop them
+        ceiling: number of pending observation events at which the "shed" policy drops new messages; twice limit by default
+        """
+        if policy not in ("block", "shed"):
+            raise Exception(f"Unknown overload policy: {policy}")
+        self.limit = limit
+        self.policy = policy
+        if ceiling is None and limit is not None:
+            ceiling = 2 * limit
+        self.ceiling = ceiling
+        self.observations = deque()  # (time queued, event)
+        self.deferred = deque()  # (time queued, event) for other events
+        self.getters = deque()  # futures waiting for an event
+        self.admitters = deque()  # futures waiting for room for inbound messages
+        self.stats = {
+            "depth": 0,
+            "max depth": 0,
+            "events": 0,
+            "wait": 0.0,
+            "max wait": 0.0,
+            "blocked": 0,
+            "shed": 0,
+            "reminders shed": 0,
+        }
+
+    @property
+    def overloaded(self):
+        return self.limit is not None and len(self.observations) >= self.limit
+
+    @property
+    def shedding(self):
+        """Whether new inbound messages are being shed"""
+        return (
+            self.policy == "shed"
+            and self.ceiling is not None
+            and len(self.observations) >= self.ceiling
+        )
+
+    def qsize(self):
+        return len(self.observations) + len(self.deferred)
+
+    def empty(self):
+        return not self.observations and not self.deferred
+
+    def put_nowait(self, event):
+        if isinstance(event, ObservationEvent):
+            self.observations.append((time.monotonic(), event))
+        else:
+            self.deferred.append((time.monotonic(), event))
+        depth = self.stats["depth"] = self.qsize()
+        self.stats["max depth"] = max(self.stats["max depth"], depth)
+        wake(self.getters)
+
+    async def put(self, event):
+        # never blocks; inbound messages wait in admit instead, since the
+        # update loop itself puts the events for its emissions
+        self.put_nowait(event)
+
+    def get_nowait(self):
+        # other events keep their turn unless the queue is overloaded
+        if self.observations and (
+            not self.deferred
+            or self.overloaded
+            or self.observations[0][0] <= self.deferred[0][0]
+        ):
+            queued, event = self.observations.popleft()
+        elif self.deferred:
+            queued, event = self.deferred.popleft()
+        else:
+            raise asyncio.QueueEmpty()
+        wait = time.monotonic() - queued
+        self.stats["depth"] = self.qsize()
+        self.stats["events"] += 1
+        self.stats["wait"] += (wait - self.stats["wait"]) / self.stats["events"]
+        self.stats["max wait"] = max(self.stats["max wait"], wait)
+        if not self.overloaded:
+            wake(self.admitters)
+        return event
+
+    async def get(self):
+        while self.empty():
+            await waiter(self.getters)
+        return self.get_nowait()
+
+    async def admit(self):
+        """Wait for room for inbound messages, under the "block" policy"""
+        if self.policy == "shed" or not self.overloaded:
+            return
+        self.stats["blocked"] += 1
+        while self.overloaded:
+            await waiter(self.admitters)
+
+    def shed(self, message):
+        """Count a new inbound message dropped while shedding"""
+        self.stats["shed"] += 1
+        logger.debug(f"Shed {message}")
+
+
+def waiter(waiters):
+    future = asyncio.get_running_loop().create_future()
+    waiters.append(future)
+    return future
+
+
+def wake(waiters):
+    while waiters:
+        future = waiters.popleft()
+        # skip the futures of cancelled waits
+        if not future.done():
+            future.set_result(None)
+            return
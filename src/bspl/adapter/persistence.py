@@ -0,0 +1,175 @@
+"""
+Durable history for adapters.
+
+A Journal keeps an append-only log of every message added to a Store, plus
+periodic snapshots of the store's contents.  Records are buffered and written
+with a single fsync per commit, so the adapter can commit once per batch of
+emissions or receptions instead of once per message.
+
+On startup, the snapshot and then the log are replayed into the store.
+
+A sharded agent keeps a separate journal for each worker, in shard-<index>
+subdirectories of the path, since each worker's store holds its own slice of
+the history; the number of shards can't change once they have been written.
+"""
+
+import os
+import json
+import logging
+from .message import Message
+from .store import Tombstone
+
+logger = logging.getLogger("bspl.persistence")
+
+
+def record(message):
+    return {
+        "schema": message.schema.qualified_name,
+        "payload": dict(message.payload),
+        "system": message.system,
+    }
+
+
+class Journal:
+    def __init__(self, path, snapshot_every=10000, batch=1000, fsync=True):
+        """
+        path: directory for the log and snapshot files; created if missing
+        snapshot_every: number of logged messages after which to take a snapshot
+        batch: maximum number of records to buffer between commits
+        fsync: force committed records to disk, not just to the OS
+        """
+        self.path = path
+        self.snapshot_every = snapshot_every
+        self.batch = batch
+        self.fsync = fsync
+        os.makedirs(path, exist_ok=True)
+        self.log_path = os.path.join(path, "history.log")
+        self.snapshot_path = os.path.join(path, "history.snapshot")
+        self.buffer = []
+        self.logged = 0  # records in the log since the last snapshot
+        self.log = None
+
+    def sharded(self, shards):
+        """Check that the journal can be split across shards workers"""
+        if any(True for _ in self.entries()):
+            raise Exception(f"Journal at {self.path} was written by an unsharded agent")
+        count_path = os.path.join(self.path, "shards")
+        if os.path.exists(count_path):
+            with open(count_path) as f:
+                count = int(f.read())
+            if count != shards:
+                raise Exception(
+                    f"Journal at {self.path} was written by {count} shards, not {shards}"
+                )
+        else:
+            with open(count_path, "w") as f:
+                f.write(str(shards))
+
+    def shard(self, index):
+        """The journal for the worker with index"""
+        return Journal(
+            os.path.join(self.path, f"shard-{index}"),
+            self.snapshot_every,
+            self.batch,
+            self.fsync,
+        )
+
+    def append(self, message):
+        self.buffer.append(json.dumps(record(message), separators=(",", ":")))
+        if len(self.buffer) >= self.batch:
+            self.commit()
+
+    def commit(self, store=None):
+        """
+        Write buffered records with a single fsync, and take a snapshot of
+        store if enough records have been logged since the last one.
+        """
+        if self.buffer:
+            if self.log is None:
+                self.log = open(self.log_path, "a", encoding="utf8")
+            self.log.write("\n".join(self.buffer) + "\n")
+            self.log.flush()
+            if self.fsync:
+                os.fsync(self.log.fileno())
+            self.logged += len(self.buffer)
+            self.buffer.clear()
+        if store is not None and self.logged >= self.snapshot_every:
+            self.snapshot(store)
+
+    def snapshot(self, store):
+        """Replace the snapshot with the current contents of store, and truncate the log"""
+        tmp = self.snapshot_path + ".tmp"
+        with open(tmp, "w", encoding="utf8") as f:
+            for system, root in store.contexts.items():
+                for path, context in store.walk(root):
+                    if isinstance(context, Tombstone):
+                        entry = {
+                            "tombstone": [list(p) for p in path],
+                            "system": system,
+                            "bindings": context._bindings,
+                            "keys": [
+                                [schema.qualified_name, list(key)]
+                                for (_, schema, key) in context.hashes
+                            ],
+                        }
+                        f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+                    else:
+                        for m in context._messages.values():
+                            f.write(json.dumps(record(m), separators=(",", ":")) + "\n")
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+        open(self.log_path, "w").close()
+        self.logged = 0
+        logger.debug(f"Wrote snapshot to {self.snapshot_path}")
+
+    def entries(self):
+        for path in (self.snapshot_path, self.log_path):
+            if os.path.exists(path):
+                with open(path, encoding="utf8") as f:
+                    for line in f:
+                        line = line.strip()
+                        if line:
+                            yield json.loads(line)
+
+    def replay(self, store, schemas):
+        """
+        Restore the contents of store from the snapshot and log.
+
+        schemas: a dictionary of message schemas by qualified name
+        Returns the restored messages.
+        """
+        journal, store.journal = store.journal, None
+        messages = []
+        try:
+            for entry in self.entries():
+                if "tombstone" in entry:
+                    store.restore_tombstone(
+                        entry["system"],
+                        tuple(tuple(p) for p in entry["tombstone"]),
+                        entry["bindings"],
+                        [(schemas[s], tuple(key)) for s, key in entry["keys"]],
+                    )
+                else:
+                    m = Message(
+                        schemas[entry["schema"]],
+                        entry["payload"],
+                        system=entry["system"],
+                    )
+                    store.add(m)
+                    messages.append(m)
+        finally:
+            store.journal = journal
+        if os.path.exists(self.log_path):
+            with open(self.log_path, encoding="utf8") as f:
+                self.logged = sum(1 for line in f if line.strip())
+        return messages
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+            self.log = None
@@ -1,11 +1,16 @@
 import asyncio
+import os
 import socket
+import stat
 import json
 import ijson
+import logging
 import datetime
 from asyncio.queues import Queue
 from .message import Message
 
+logger = logging.getLogger("bspl.receiver")
+
 
 def unbundle(bundle):
     return bundle
@@ -16,37 +21,55 @@ def decode(msg):
 
 
 class UDPReceiverProtocol:
-    def __init__(self, queue, adapter):
+    def __init__(self, queue, adapter, stats=None):
         self.queue = queue
         self.adapter = adapter
+        self.stats = stats if stats is not None else {"dropped": 0}
 
     def datagram_received(self, data, addr):
-        self.queue.put_nowait(data)
+        try:
+            self.queue.put_nowait(data)
+        except asyncio.QueueFull:
+            # the adapter is falling behind; senders recover lost datagrams
+            # as they would from the network
+            self.stats["dropped"] += 1
 
     def connection_made(self, transport):
         self.transport = transport
 
     def connection_lost(self, exc):
-        adapter.debug(f"Connection lost: {exc}")
+        self.adapter.debug(f"Connection lost: {exc}")
 
 
 class Receiver:
     """An Receiver just needs the send(message) method."""
 
-    def __init__(self, address, decoder=decode, unbundler=unbundle):
+    def __init__(
+        self, address, decoder=decode, unbundler=unbundle, batch=1000, limit=10000
+    ):
+        """
+        address: (host, port) to listen on
+        decoder: function decoding a datagram into a bundle
+        unbundler: function extracting the messages from a bundle
+        batch: maximum number of pending datagrams to pass to the adapter at once
+        limit: maximum number of pending datagrams; further datagrams are dropped
+        """
         self.address = address
         self.decode = decoder
         self.unbundle = unbundler
+        self.batch = batch
+        self.limit = limit
         self.listening = False
+        self.stats = {"dropped": 0}
 
     async def task(self, adapter):
         """Start loop for transmitting messages in outgoing queue"""
         self.adapter = adapter
-        self.queue = Queue()
+        self.queue = Queue(self.limit)
         loop = asyncio.get_running_loop()
         adapter.debug(f"Attempting to bind: {self.address}")
         transport, protocol = await loop.create_datagram_endpoint(
-            lambda: UDPReceiverProtocol(self.queue, adapter),
+            lambda: UDPReceiverProtocol(self.queue, adapter, self.stats),
             local_addr=(self.address[0], self.address[1]),
         )
         self.listening = True
@@ -56,11 +79,14 @@ class Receiver:
 
     async def process(self):
         while self.listening:
-            data = await self.queue.get()
-            bundle = self.decode(data)
-            messages = self.unbundle(bundle)
-            for m in messages:
-                await self.adapter.receive(m)
+            # wait for a datagram, then take every other one that is already pending
+            datagrams = [await self.queue.get()]
+            while len(datagrams) < self.batch and not self.queue.empty():
+                datagrams.append(self.queue.get_nowait())
+            messages = []
+            for data in datagrams:
+                messages.extend(self.unbundle(self.decode(data)))
+            await self.adapter.receive_many(messages)
         self.adapter.info("Stopped listening")
 
     async def stop(self):
@@ -68,6 +94,55 @@ class Receiver:
         self.transport.close()
 
 
+def unlink_socket(path):
+    """Remove a stale socket file left at path by an earlier run"""
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+class UnixReceiver(Receiver):
+    """Receiver for datagrams sent over a Unix domain socket by UnixEmitter"""
+
+    def __init__(
+        self,
+        path,
+        decoder=decode,
+        unbundler=unbundle,
+        batch=1000,
+        buffer=2**20,
+        limit=10000,
+    ):
+        """
+        path: filesystem path to bind the socket to
+        buffer: socket receive buffer size in bytes
+        """
+        super().__init__(os.fspath(path), decoder, unbundler, batch, limit)
+        self.buffer = buffer
+
+    async def task(self, adapter):
+        self.adapter = adapter
+        self.queue = Queue(self.limit)
+        loop = asyncio.get_running_loop()
+        unlink_socket(self.address)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.buffer)
+        sock.bind(self.address)
+        transport, protocol = await loop.create_datagram_endpoint(
+            lambda: UDPReceiverProtocol(self.queue, adapter, self.stats), sock=sock
+        )
+        self.listening = True
+        self.transport = transport
+        adapter.debug(f"Listening on {self.address}")
+        loop.create_task(self.process())
+
+    async def stop(self):
+        await super().stop()
+        unlink_socket(self.address)
+
+
 class MockReceiver:
     """
     A mock receiver that doesn't bind to any network ports.
@@ -132,3 +207,99 @@ class TCPReceiver:
 
     async def stop(self):
         await self.server.close()
+
+
+class StreamReceiver:
+    """
+    Receiver for TCP streams of length-prefixed frames, as sent by StreamEmitter.
+
+    Every complete frame in a read is decoded together, by joining the frames
+    into a single bundle for the decoder.
+    """
+
+    def __init__(self, address, decoder=decode, chunk=2**16, max_frame=2**24):
+        """
+        address: (host, port) to listen on
+        decoder: function decoding a '[' ... ',' ... ']' bundle into messages
+        chunk: maximum bytes to read at a time
+        max_frame: largest frame to accept; a connection announcing a larger one is closed
+        """
+        self.address = address
+        self.decode = decoder
+        self.chunk = chunk
+        self.max_frame = max_frame
+        self.listening = False
+        self.writers = set()
+
+    async def serve(self):
+        return await asyncio.start_server(self.process, *self.address)
+
+    async def task(self, adapter):
+        self.adapter = adapter
+        self.server = await self.serve()
+        self.listening = True
+        adapter.debug(f"Listening on {self.address}")
+
+    def frames(self, buffer):
+        """Remove and return the complete frames at the start of buffer"""
+        frames = []
+        pos = 0
+        while len(buffer) - pos >= 4:
+            length = int.from_bytes(buffer[pos : pos + 4], "big")
+            if length > self.max_frame:
+                # leave it for process to reject
+                break
+            end = pos + 4 + length
+            if end > len(buffer):
+                break
+            frames.append(bytes(buffer[pos + 4 : end]))
+            pos = end
+        del buffer[:pos]
+        return frames
+
+    async def process(self, reader, writer):
+        self.writers.add(writer)
+        buffer = bytearray()
+        try:
+            while self.listening:
+                data = await reader.read(self.chunk)
+                if not data:
+                    break
+                buffer += data
+                frames = self.frames(buffer)
+                if frames:
+                    await self.adapter.receive_many(
+                        self.decode(b"[" + b",".join(frames) + b"]")
+                    )
+                if len(buffer) >= 4:
+                    length = int.from_bytes(buffer[:4], "big")
+                    if length > self.max_frame:
+                        # a corrupt or hostile length; don't buffer the frame
+                        logger.warning(
+                            f"Closing stream: frame of {length} bytes exceeds {self.max_frame}"
+                        )
+                        break
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+    async def stop(self):
+        self.listening = False
+        self.server.close()
+        for writer in list(self.writers):
+            writer.close()
+
+
+class UnixStreamReceiver(StreamReceiver):
+    """StreamReceiver listening on a Unix domain socket path"""
+
+    def __init__(self, path, decoder=decode, chunk=2**16, max_frame=2**24):
+        super().__init__(os.fspath(path), decoder, chunk, max_frame)
+
+    async def serve(self):
+        unlink_socket(self.address)
+        return await asyncio.start_unix_server(self.process, self.address)
+
+    async def stop(self):
+        await super().stop()
+        unlink_socket(self.address)
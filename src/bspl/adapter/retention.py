@@ -0,0 +1,88 @@
+import sys
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger("bspl.retention")
+
+
+def footprint(context):
+    """Approximate memory held by the messages of a context and its descendants"""
+    size = 0
+    for c in context.flatten_all():
+        for m in c._messages.values():
+            size += sys.getsizeof(m) + sys.getsizeof(m.payload) + sys.getsizeof(m._meta)
+            size += sum(sys.getsizeof(v) for v in m.payload.values())
+    return size
+
+
+class Retention:
+    """
+    Policy for evicting completed enactments from a Store.
+
+    An enactment is complete once every public out parameter of its protocol
+    is bound in its context.  Completed enactments are kept in full until the
+    policy evicts them, after which the store keeps only a compact Tombstone
+    that still answers duplicate and integrity checks.
+
+    The policy is enforced whenever an enactment completes, and, when an age
+    is given, periodically by the adapter, so enactments still expire while
+    nothing new completes.
+
+    Example:
+      Adapter(name, systems, agents, retention=Retention(count=10000, age=600))
+    """
+
+    def __init__(self, count=None, age=None, memory=None, interval=None):
+        """
+        count: maximum number of completed enactments to keep in full
+        age: seconds to keep a completed enactment in full
+        memory: approximate budget in bytes for completed enactments kept in full
+        interval: seconds between periodic checks of the age limit; a tenth of age by default
+        """
+        self.count = count
+        self.age = age
+        self.memory = memory
+        self.interval = interval if interval is not None else age and age / 10
+        # (system, path) -> (context, completion time, footprint), oldest first
+        self.completed = OrderedDict()
+        self.size = 0
+        self.evicted = 0
+
+    def complete(self, store, system, path, context):
+        """Record a newly completed enactment and enforce the policy"""
+        if (system, path) in self.completed:
+            return
+        size = footprint(context) if self.memory is not None else 0
+        self.completed[(system, path)] = (context, time.monotonic(), size)
+        self.size += size
+        self.enforce(store)
+
+    def expired(self, now):
+        if not self.completed:
+            return False
+        _, (_, completed_at, _) = next(iter(self.completed.items()))
+        return (
+            (self.count is not None and len(self.completed) > self.count)
+            or (self.age is not None and now - completed_at > self.age)
+            or (self.memory is not None and self.size > self.memory)
+        )
+
+    def enforce(self, store):
+        """Evict the oldest completed enactments until the policy is satisfied"""
+        now = time.monotonic()
+        while self.expired(now):
+            (system, path), (context, _, size) = self.completed.popitem(last=False)
+            self.size -= size
+            store.evict(system, path, context)
+            self.evicted += 1
+            logger.debug(f"Evicted enactment {dict(path)} of system {system}")
+
+    async def task(self, store):
+        """Enforce the age limit periodically, for as long as the adapter runs"""
+        if not self.interval:
+            return
+        while True:
+            await asyncio.sleep(self.interval)
+            self.enforce(store)
@@ -75,7 +75,13 @@ class Scheduler:
     async def run(self):
         if self.policies:
             logger.debug(f"running policies: {self.policies}")
+            events = self.adapter.events
             for p in self.policies:
+                if events.overloaded and getattr(p, "key", None) == "reminders":
+                    # reminders would only add to the backlog; try again next time
+                    events.stats["reminders shed"] += 1
+                    logger.info(f"scheduler: Skipping {p} while overloaded")
+                    continue
                 # give policy access to full history for conditional evaluation
                 messages = p.run(self.adapter.history)
                 if self._backoff:
@@ -0,0 +1,311 @@
+"""
+Sharded adapter runtime.
+
+A sharded agent runs N worker processes, each a forked copy of the same
+Adapter (with all of its reactors, generators and decision handlers).  The
+parent process keeps the network receivers, so the agent still presents one
+logical endpoint, and routes every incoming message to the worker that owns
+its enactment.  Ownership is decided by the value of the outermost protocol
+key bound by the message, so every message of an enactment (e.g. an order and
+all of its items) lands in the same worker, and each worker's Store holds a
+disjoint slice of the history.
+
+Workers emit directly through their own emitter.  Messages a worker wants to
+send for an enactment owned by another worker are handed to the owner through
+the parent, so the owner's Store remains the single authority on that
+enactment.
+
+Writes to the pipes go through a Writer thread per pipe, so neither process
+ever blocks its event loop on a full pipe; otherwise the parent and a worker
+could each wait for the other to read, freezing the agent.  The router stops
+queueing inbound messages for a worker once limit items are pending for it,
+dropping them as a full network buffer would, so a slow worker does not grow
+the parent's memory without bound.  Messages forwarded between workers are
+always queued, since they are already in the sender's history.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import queue
+import threading
+import zlib
+import aiorun
+from .message import Message
+
+logger = logging.getLogger("bspl.sharding")
+
+
+def root_key(protocol, schema):
+    """Return the outermost key of protocol bound by schema, or None"""
+    for k in protocol.keys:
+        if k in schema.keys:
+            return k
+    return None
+
+
+def shard_of(system, protocol, schema, payload, shards):
+    """Select the worker responsible for the enactment of payload"""
+    k = root_key(protocol, schema)
+    if k is None:
+        return 0
+    value = f"{system}:{payload.get(k)}"
+    return zlib.crc32(value.encode()) % shards
+
+
+class Writer:
+    """
+    Sends objects over a multiprocessing connection from a dedicated thread,
+    so a full pipe holds up the thread instead of the event loop.
+
+    Must be created after forking, since threads do not survive a fork.
+    """
+
+    def __init__(self, connection, limit=None):
+        """
+        connection: the multiprocessing connection to send over
+        limit: number of pending objects at which the writer is full; None for no limit
+        """
+        self.connection = connection
+        self.limit = limit
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    @property
+    def full(self):
+        return self.limit is not None and self.queue.qsize() >= self.limit
+
+    def send(self, obj):
+        self.queue.put(obj)
+
+    def run(self):
+        while True:
+            obj = self.queue.get()
+            if obj is None:
+                return
+            try:
+                self.connection.send(obj)
+            except OSError as e:
+                logger.warning(f"Pipe closed: {e}")
+                return
+
+    def close(self):
+        self.queue.put(None)
+
+
+class Shard:
+    """Handle installed on a worker's adapter as `adapter.shard`"""
+
+    def __init__(self, index, shards, connection):
+        self.index = index
+        self.shards = shards
+        self.connection = connection
+        self.writer = Writer(connection)
+
+    def owner(self, adapter, message):
+        protocol = adapter.systems[message.system]["protocol"]
+        return shard_of(
+            message.system, protocol, message.schema, message.payload, self.shards
+        )
+
+    def route(self, adapter, messages):
+        """
+        Forward messages owned by other workers, and return the remainder
+        """
+        local = []
+        for m in messages:
+            owner = self.owner(adapter, m)
+            if owner == self.index:
+                local.append(m)
+            else:
+                self.writer.send(("send", owner, m.serialize(), m._dest))
+        return local
+
+
+class ShardReceiver:
+    """Receiver for a worker, fed by the router over a pipe"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.listening = False
+
+    async def task(self, adapter):
+        self.adapter = adapter
+        self.queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        loop.add_reader(self.connection.fileno(), self.read)
+        self.listening = True
+        loop.create_task(self.process())
+
+    def read(self):
+        while self.connection.poll():
+            try:
+                self.queue.put_nowait(self.connection.recv())
+            except EOFError:
+                asyncio.get_running_loop().remove_reader(self.connection.fileno())
+                self.listening = False
+                return
+
+    async def process(self):
+        while self.listening:
+            kind, data, dest = await self.queue.get()
+            if kind == "receive":
+                await self.adapter.receive(data)
+            elif kind == "receive_many":
+                await self.adapter.receive_many(data)
+            elif kind == "send":
+                schema = self.adapter.messages[data["schema"]]
+                message = Message(
+                    schema,
+                    data["payload"],
+                    meta=data.get("meta", {}),
+                    dest=dest,
+                    adapter=self.adapter,
+                )
+                await self.adapter.send(message)
+
+    async def stop(self):
+        self.listening = False
+        asyncio.get_running_loop().remove_reader(self.connection.fileno())
+
+
+class Router:
+    """
+    Stand-in adapter for the parent process.
+
+    The network receivers call `receive` and `receive_many` on it exactly as
+    they would on an Adapter; each message is passed on to the worker that
+    owns it.
+    """
+
+    def __init__(self, adapter, connections, limit=10000):
+        """
+        adapter: the agent's adapter, forked into the workers
+        connections: a pipe connection to each worker
+        limit: number of items pending for a worker at which inbound messages for it are dropped
+        """
+        self.adapter = adapter
+        self.connections = connections
+        self.writers = [Writer(c, limit) for c in connections]
+        self.shards = len(connections)
+        self.stats = {"dropped": 0}
+
+    def debug(self, msg):
+        self.adapter.debug(msg)
+
+    def info(self, msg):
+        self.adapter.info(msg)
+
+    def warning(self, msg):
+        self.adapter.warning(msg)
+
+    def owner(self, data):
+        schema = self.adapter.messages[data["schema"]]
+        system = data.get("meta", {}).get("system")
+        protocol = self.adapter.systems[system]["protocol"]
+        return shard_of(system, protocol, schema, data["payload"], self.shards)
+
+    async def receive(self, data):
+        if not isinstance(data, dict):
+            self.warning("Data does not parse to a dictionary: {}".format(data))
+            return
+        self.admit(self.owner(data), ("receive", data, None), 1)
+
+    async def receive_many(self, batch):
+        batches = {}
+        for data in batch:
+            if not isinstance(data, dict):
+                self.warning("Data does not parse to a dictionary: {}".format(data))
+                continue
+            batches.setdefault(self.owner(data), []).append(data)
+        for owner, data in batches.items():
+            self.admit(owner, ("receive_many", data, None), len(data))
+
+    def admit(self, owner, item, count):
+        """Queue inbound messages for owner, unless it is too far behind"""
+        writer = self.writers[owner]
+        if writer.full:
+            self.stats["dropped"] += count
+            logger.debug(f"Dropped {count} messages for shard {owner}")
+            return
+        writer.send(item)
+
+    def forward(self, connection):
+        while connection.poll():
+            try:
+                kind, owner, data, dest = connection.recv()
+            except EOFError:
+                asyncio.get_running_loop().remove_reader(connection.fileno())
+                return
+            self.writers[owner].send((kind, data, dest))
+
+    async def task(self):
+        loop = asyncio.get_running_loop()
+        for c in self.connections:
+            loop.add_reader(c.fileno(), self.forward, c)
+        for r in self.adapter.receivers:
+            await r.task(self)
+
+
+def worker(adapter, index, shards, connection, tasks, use_uvloop):
+    adapter.shard = Shard(index, shards, connection)
+    adapter.receivers = [ShardReceiver(connection)]
+    journal = getattr(adapter.history, "journal", None)
+    if journal:
+        # each worker journals and restores its own slice of the history
+        adapter.history.journal = journal.shard(index)
+        adapter.restore()
+    if hasattr(adapter.history, "shard"):
+        # e.g. SQLiteStore, which keeps a database per worker
+        adapter.history.shard(index)
+    if index != 0:
+        # only the first worker runs the agent's own tasks
+        for t in tasks:
+            t.close()
+        tasks = ()
+    adapter.start(*tasks, use_uvloop=use_uvloop)
+
+
+def run(adapter, tasks, shards, use_uvloop=True):
+    """
+    Fork `shards` workers from adapter and route the network traffic between them
+    """
+    journal = getattr(adapter.history, "journal", None)
+    if journal:
+        journal.sharded(shards)
+    if hasattr(adapter.history, "sharded"):
+        adapter.history.sharded(shards)
+    context = multiprocessing.get_context("fork")
+    connections = []
+    processes = []
+    for i in range(shards):
+        parent, child = context.Pipe()
+        p = context.Process(
+            target=worker,
+            args=(adapter, i, shards, child, tasks, use_uvloop),
+            daemon=True,
+        )
+        p.start()
+        connections.append(parent)
+        processes.append(p)
+    for t in tasks:
+        t.close()
+
+    router = Router(adapter, connections)
+
+    if use_uvloop:
+        try:
+            import uvloop
+        except:
+            use_uvloop = False
+
+    async def main():
+        await router.task()
+        adapter.info(f"Routing to {shards} shards")
+
+    try:
+        aiorun.run(main(), stop_on_unhandled_errors=True, use_uvloop=use_uvloop)
+    finally:
+        for p in processes:
+            p.terminate()
@@ -0,0 +1,306 @@
+"""
+Shared-memory transport for agents in separate processes on the same host.
+
+Each emitter gets a single-producer, single-consumer ring buffer in shared
+memory for every receiver it sends to.  Encoded bundles are written into the
+ring once, and the receiver reads them in place through a memoryview.  The
+receiver's doorbell is a named pipe at its address: after writing to a ring,
+the emitter writes the ring's name to the pipe, which wakes the receiver's
+event loop.  The receiver attaches to any newly named rings and drains every
+ring it has attached, so records are still read when a full pipe made an
+emitter skip its doorbell.  Each ring records its emitter's process ID, which
+the emitter clears when it stops; the receiver closes rings whose emitter has
+stopped, or has exited without stopping, once they are drained.
+
+Example:
+  agents = {"C": ["/tmp/bspl-C"], "S": ["/tmp/bspl-S"]}
+  Adapter("S", systems, agents, emitter=SharedMemoryEmitter(),
+          receiver=SharedMemoryReceiver("/tmp/bspl-S"))
+
+The binary Codec decodes the in-place views directly; the default JSON
+decoder has to copy each bundle out of the ring before parsing it.
+"""
+
+import os
+import json
+import stat
+import struct
+import asyncio
+import logging
+from asyncio.queues import Queue
+from collections import defaultdict
+from multiprocessing import shared_memory, resource_tracker
+from .emitter import encode, encode_all
+
+logger = logging.getLogger("bspl.shm")
+
+# ring header: bytes written, bytes read, capacity, producer's process ID (0 once stopped)
+header = struct.Struct("<QQQQ")
+owner = struct.Struct("<Q")
+length = struct.Struct("<I")
+WRAP = 0xFFFFFFFF  # record marking unused space at the end of the ring
+
+created = set()  # names of the rings created by this process
+
+
+def align(n):
+    return (n + 3) & ~3
+
+
+class Ring:
+    """
+    Single-producer, single-consumer ring of byte records in shared memory.
+
+    Positions are running byte counts, so the ring is empty when they are
+    equal; only the producer advances the first and only the consumer the
+    second.
+    """
+
+    def __init__(self, shm):
+        self.shm = shm
+        self.buf = shm.buf
+        self.capacity = header.unpack_from(self.buf)[2]
+
+    @classmethod
+    def create(cls, size):
+        size = align(size)
+        shm = shared_memory.SharedMemory(create=True, size=header.size + size)
+        header.pack_into(shm.buf, 0, 0, 0, size, os.getpid())
+        created.add(shm.name)
+        return cls(shm)
+
+    @classmethod
+    def attach(cls, name):
+        # the emitter that created the segment unlinks it; don't let this
+        # process's resource tracker do so as well
+        try:
+            shm = shared_memory.SharedMemory(name, track=False)  # Python 3.13+
+        except TypeError:
+            shm = shared_memory.SharedMemory(name)
+            if name not in created:
+                # processes sharing a tracker with the emitter will see it
+                # complain when the emitter unlinks the segment
+                resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm)
+
+    def unlink(self):
+        created.discard(self.shm.name)
+        self.shm.unlink()
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def release(self):
+        """Mark the ring as no longer written to, for the consumer"""
+        owner.pack_into(self.buf, 24, 0)
+
+    @property
+    def released(self):
+        return owner.unpack_from(self.buf, 24)[0] == 0
+
+    @property
+    def alive(self):
+        """Whether the producer is still running and may write more records"""
+        (pid,) = owner.unpack_from(self.buf, 24)
+        if not pid:
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass  # running, as another user
+        return True
+
+    def write(self, data):
+        """Append data as one record; return False if the ring is too full"""
+        written, read, capacity, _ = header.unpack_from(self.buf)
+        size = align(length.size + len(data))
+        offset = written % capacity
+        # records are contiguous, so skip the end of the ring if it is too short
+        padding = capacity - offset if capacity - offset < size else 0
+        if written + padding + size - read > capacity:
+            return False
+        if padding:
+            length.pack_into(self.buf, header.size + offset, WRAP)
+            offset = 0
+        start = header.size + offset + length.size
+        self.buf[start : start + len(data)] = data
+        length.pack_into(self.buf, header.size + offset, len(data))
+        # publish the record
+        struct.pack_into("<Q", self.buf, 0, written + padding + size)
+        return True
+
+    def drain(self, consume):
+        """Call consume with a memoryview of each record, in order, freeing each after"""
+        written, read, capacity, _ = header.unpack_from(self.buf)
+        while read < written:
+            offset = read % capacity
+            (n,) = length.unpack_from(self.buf, header.size + offset)
+            if n == WRAP:
+                read += capacity - offset
+            else:
+                start = header.size + offset + length.size
+                try:
+                    with self.buf[start : start + n] as view:
+                        consume(view)
+                except Exception:
+                    # skip the bad record instead of reading it again forever
+                    logger.exception(f"Dropped unreadable record from {self.name}")
+                read += align(length.size + n)
+            struct.pack_into("<Q", self.buf, 8, read)
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+
+
+def decode(data):
+    return json.loads(bytes(data))
+
+
+class SharedMemoryEmitter:
+    def __init__(self, encoder=encode, size=2**22):
+        """
+        encoder: function encoding a message as bytes
+        size: bytes of shared memory for each receiver's ring
+        """
+        self.encode = encoder
+        self.size = size
+        self.peers = {}  # dest -> (ring, doorbell fd)
+        self.stats = {"bytes": 0, "packets": 0, "dropped": 0}
+
+    def peer(self, dest):
+        peer = self.peers.get(dest)
+        if peer is None:
+            try:
+                bell = os.open(dest, os.O_WRONLY | os.O_NONBLOCK)
+            except OSError as e:
+                # no receiver yet; try again with the next message
+                logger.debug(f"No receiver at {dest}: {e}")
+                return None
+            peer = self.peers[dest] = (Ring.create(self.size), bell)
+        return peer
+
+    def transmit(self, packet, dest):
+        peer = self.peer(dest)
+        if peer is None or not peer[0].write(packet):
+            logger.warning(f"Dropped packet to {dest}")
+            self.stats["dropped"] += 1
+            return
+        ring, bell = peer
+        try:
+            os.write(bell, ring.name.encode() + b"\n")
+        except BlockingIOError:
+            pass  # the receiver has doorbells pending, and drains every ring on each
+        except BrokenPipeError:
+            # the receiver is gone; start over if it comes back
+            logger.warning(f"Receiver at {dest} has stopped")
+            self.close(dest)
+            self.stats["dropped"] += 1
+            return
+        self.stats["bytes"] += len(packet)
+        self.stats["packets"] += 1
+
+    async def send(self, message):
+        self.transmit(b"[" + self.encode(message) + b"]", message.dest)
+
+    async def bulk_send(self, messages):
+        bundles = defaultdict(list)
+        for m, data in encode_all(self.encode, messages):
+            bundles[m.dest].append(data)
+        for dest, bundle in bundles.items():
+            self.transmit(b"[" + b",".join(bundle) + b"]", dest)
+
+    def close(self, dest):
+        ring, bell = self.peers.pop(dest)
+        ring.release()
+        try:
+            # wake the receiver to drain and close the ring
+            os.write(bell, ring.name.encode() + b"\n")
+        except OSError:
+            pass
+        os.close(bell)
+        ring.close()
+        ring.unlink()
+
+    async def stop(self):
+        for dest in list(self.peers):
+            self.close(dest)
+
+
+class SharedMemoryReceiver:
+    def __init__(self, path, decoder=decode):
+        """
+        path: filesystem path for the doorbell pipe that emitters send to
+        decoder: function decoding a memoryview of a bundle into messages
+        """
+        self.address = os.fspath(path)
+        self.decode = decoder
+        self.rings = {}  # name -> Ring
+        self.pending = b""
+        self.listening = False
+
+    async def task(self, adapter):
+        self.adapter = adapter
+        self.queue = Queue()
+        try:
+            if stat.S_ISFIFO(os.stat(self.address).st_mode):
+                os.unlink(self.address)
+        except FileNotFoundError:
+            pass
+        os.mkfifo(self.address)
+        self.bell = os.open(self.address, os.O_RDONLY | os.O_NONBLOCK)
+        # keep a writer open, so the pipe doesn't report EOF between emitters
+        self.keepalive = os.open(self.address, os.O_WRONLY | os.O_NONBLOCK)
+        asyncio.get_running_loop().add_reader(self.bell, self.ring)
+        self.listening = True
+        adapter.debug(f"Listening on {self.address}")
+        asyncio.get_running_loop().create_task(self.process())
+
+    def ring(self):
+        """Attach the rings named in the pending doorbells, then drain every ring"""
+        try:
+            data = self.pending + os.read(self.bell, 2**16)
+        except BlockingIOError:
+            return
+        # a read can end in the middle of a name
+        *names, self.pending = data.split(b"\n")
+        attached = False
+        for name in set(n.decode() for n in names):
+            if name not in self.rings:
+                try:
+                    self.rings[name] = Ring.attach(name)
+                    attached = True
+                except FileNotFoundError:
+                    continue  # the emitter has already stopped
+        # a doorbell may have been skipped while the pipe was full, so don't
+        # rely on the names
+        for name, ring in list(self.rings.items()):
+            # check before draining, so every record written before the
+            # release is drained; a new ring may also replace one whose
+            # emitter exited without stopping
+            gone = ring.released or (attached and not ring.alive)
+            ring.drain(lambda view: self.queue.put_nowait(self.decode(view)))
+            if gone:
+                logger.debug(f"Closing ring {name}, as its emitter has stopped")
+                ring.close()
+                del self.rings[name]
+
+    async def process(self):
+        while self.listening:
+            messages = await self.queue.get()
+            while not self.queue.empty():
+                messages.extend(self.queue.get_nowait())
+            await self.adapter.receive_many(messages)
+
+    async def stop(self):
+        self.listening = False
+        asyncio.get_running_loop().remove_reader(self.bell)
+        os.close(self.bell)
+        os.close(self.keepalive)
+        os.unlink(self.address)
+        for ring in self.rings.values():
+            ring.close()
+        self.rings.clear()
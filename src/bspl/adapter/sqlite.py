@@ -0,0 +1,268 @@
+"""
+SQLite-backed history for adapters whose history does not fit in memory.
+
+Each message schema gets a table with a column per parameter and a unique
+index on its key columns.  The context tree is materialized from the database
+one enactment at a time (everything under a value of a schema's first key),
+and recently used enactments are kept in an LRU cache in front of the
+database.
+
+The database is opened lazily by the process that first uses it.  A sharded
+agent gives each worker its own database, named after the path with the
+worker's index, e.g. history-shard-0.db; see bspl.adapter.sharding.
+
+Example:
+  Adapter(name, systems, agents, history=SQLiteStore(systems, "history.db"))
+"""
+
+import os
+import json
+import sqlite3
+import logging
+from collections import OrderedDict
+from .message import Message
+from .store import Store, Context, check
+
+logger = logging.getLogger("bspl.sqlite")
+
+
+def quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def encode(value):
+    return json.dumps(value, separators=(",", ":"))
+
+
+def first_key(schema):
+    return next(iter(schema.keys), None)
+
+
+class Enactments:
+    """
+    Mapping of one root key's values to their contexts, for one system.
+
+    Contexts missing from the cache are loaded from the database on demand.
+    """
+
+    def __init__(self, store, system, key):
+        self.store = store
+        self.system = system
+        self.key = key
+
+    def _id(self, value):
+        return (self.system, self.key, value)
+
+    def __contains__(self, value):
+        return self.get(value) is not None
+
+    def __getitem__(self, value):
+        context = self.get(value)
+        if context is None:
+            raise KeyError(value)
+        return context
+
+    def __setitem__(self, value, context):
+        self.store.cache_context(self._id(value), context)
+
+    def get(self, value, default=None):
+        context = self.store.cached_context(self._id(value))
+        if context is None:
+            context = self.store.load_enactment(self.system, self.key, value)
+        return context if context is not None else default
+
+    # iteration only covers cached enactments
+    def keys(self):
+        return [
+            v for (s, k, v) in self.store.cache if s == self.system and k == self.key
+        ]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def values(self):
+        return [self.store.cache[self._id(v)] for v in self.keys()]
+
+    def items(self):
+        return [(v, self.store.cache[self._id(v)]) for v in self.keys()]
+
+
+class SQLiteStore(Store):
+    def __init__(self, systems, path=":memory:", cache_size=1024, batch=1000):
+        """
+        systems: the systems to store messages for, as for Store
+        path: SQLite database file
+        cache_size: number of enactments to keep in memory
+        batch: maximum number of uncommitted messages before an implicit commit
+        """
+        super().__init__(systems)
+        self.path = path
+        self._db = None  # opened on first use; see db
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # (system, key, value) -> Context
+        self.batch = batch
+        self.pending = 0
+        self.schemas = {}  # qualified name -> schema
+        self.system_schemas = {}  # system -> set of schemas
+
+        for system, s in systems.items():
+            protocol = s["protocol"]
+            self.system_schemas[system] = set(protocol.messages.values())
+            for schema in self.system_schemas[system]:
+                self.schemas[schema.qualified_name] = schema
+                k = first_key(schema)
+                root = self.contexts[system]
+                if k is not None and k not in root.subcontexts:
+                    root.subcontexts[k] = Enactments(self, system, k)
+
+    @property
+    def db(self):
+        if self._db is None:
+            self.open()
+        return self._db
+
+    def open(self):
+        self._db = sqlite3.connect(self.path)
+        for schema in self.schemas.values():
+            self.create_table(schema)
+        for system, schemas in self.system_schemas.items():
+            for schema in schemas:
+                if first_key(schema) is None:
+                    # keyless messages live in the root context, which is always loaded
+                    for m in self.select(schema, system):
+                        self.contexts[system].add(m)
+
+    def sharded(self, shards):
+        """Check that the history can be split across shards workers"""
+        if self._db is not None:
+            # the workers would share the connection
+            raise Exception("SQLiteStore cannot be sharded after it has been opened")
+        if self.path != ":memory:" and os.path.exists(self.path):
+            raise Exception(f"Database at {self.path} was written by an unsharded agent")
+
+    def shard(self, index):
+        """Switch to the database for the worker with index"""
+        if self.path != ":memory:":
+            root, ext = os.path.splitext(os.fspath(self.path))
+            self.path = f"{root}-shard-{index}{ext}"
+
+    def create_table(self, schema):
+        table = quote(schema.qualified_name)
+        columns = ", ".join(quote(p) for p in schema.public_parameters)
+        keys = ", ".join(["system"] + [quote(k) for k in schema.keys])
+        self.db.execute(f"CREATE TABLE IF NOT EXISTS {table} (system, {columns})")
+        index = quote(schema.qualified_name + "/key")
+        self.db.execute(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS {index} ON {table} ({keys})"
+        )
+
+    def select(self, schema, system=None, **conditions):
+        """Yield the messages of schema matching the given parameter values"""
+        parameters = list(schema.public_parameters)
+        clauses = []
+        values = []
+        if system is not None:
+            clauses.append("system = ?")
+            values.append(encode(system))
+        for p, v in conditions.items():
+            clauses.append(f"{quote(p)} = ?")
+            values.append(encode(v))
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        columns = ", ".join(["system"] + [quote(p) for p in parameters])
+        query = f"SELECT {columns} FROM {quote(schema.qualified_name)}{where}"
+        for row in self.db.execute(query, values).fetchall():
+            payload = {
+                p: json.loads(v) for p, v in zip(parameters, row[1:]) if v is not None
+            }
+            yield Message(schema, payload, system=json.loads(row[0]))
+
+    def insert(self, message):
+        schema = message.schema
+        parameters = [p for p in schema.public_parameters if p in message.payload]
+        columns = ", ".join(["system"] + [quote(p) for p in parameters])
+        placeholders = ", ".join("?" * (len(parameters) + 1))
+        table = quote(schema.qualified_name)
+        self.db.execute(
+            f"INSERT OR REPLACE INTO {table} ({columns}) VALUES ({placeholders})",
+            [encode(message.system)] + [encode(message.payload[p]) for p in parameters],
+        )
+
+    def cached_context(self, id):
+        context = self.cache.get(id)
+        if context is not None:
+            self.cache.move_to_end(id)
+        return context
+
+    def cache_context(self, id, context):
+        self.cache[id] = context
+        self.cache.move_to_end(id)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def load_enactment(self, system, key, value):
+        """Materialize the context tree for one enactment, or return None if it has no messages"""
+        messages = []
+        for schema in self.schemas.values():
+            if first_key(schema) == key and schema in self.system_schemas[system]:
+                messages.extend(self.select(schema, system, **{key: value}))
+        if not messages:
+            return None
+        context = Context()
+        self.cache_context((system, key, value), context)
+        for m in messages:
+            self.context(m).add(m)
+        return context
+
+    def add(self, *messages):
+        super().add(*messages)
+        for m in messages:
+            self.insert(m)
+        self.pending += len(messages)
+        if self.pending >= self.batch:
+            self.commit()
+
+    def commit(self):
+        if self._db is not None:
+            self._db.commit()
+        self.pending = 0
+
+    def messages(self, *args, **kwargs):
+        schema = args[0] if args else kwargs.pop("schema", None)
+        schemas = [schema] if schema else self.schemas.values()
+        for s in schemas:
+            conditions = {
+                k: v
+                for k, v in kwargs.items()
+                if k in s.public_parameters and not callable(v)
+            }
+            if any(k not in s.public_parameters for k in kwargs):
+                continue
+            for m in self.select(s, **conditions):
+                if all(check(m[k], kwargs[k]) for k in kwargs):
+                    yield m
+
+    def is_duplicate(self, message):
+        k = first_key(message.schema)
+        if k is not None and self.cached_context(
+            (message.system, k, message.payload.get(k))
+        ):
+            return super().is_duplicate(message)
+
+        keys = {k: message.payload.get(k) for k in message.schema.keys}
+        if any(v is None for v in keys.values()):
+            return False
+        for match in self.select(message.schema, message.system, **keys):
+            if match == message:
+                return True
+            raise Exception(
+                "Message found with matching key {} but different parameters: {}, {}".format(
+                    message.key, message, match
+                )
+            )
+        return False
+
+    def close(self):
+        self.commit()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -14,30 +14,70 @@ def check(p, test):
         return p == test
 
 
+def fingerprint(message):
+    """Identify a message by its system, schema and key values"""
+    return (message.system, message.schema, message.key_values)
+
+
+def payload_hash(message):
+    try:
+        return hash(tuple(message.payload.items()))
+    except TypeError:
+        return None
+
+
 class Context:
     def __init__(self, parent=None):
         self.subcontexts = {}
         self._bindings = {}
         self._messages = {}
         self.parent = parent
+        # cached merge of the parent's bindings with our own; see bindings
+        self._view = None
+        self._base = None
 
     def add(self, message):
         self._bindings.update(message.payload)
         self._messages[message.schema] = message
+        self._view = None
 
     def clear(self):
         """Remove all content of the context"""
         self.__init__(self.parent)
 
+    def remove(self, *schemas):
+        """
+        Remove the messages of the given schemas from this context and its
+        subcontexts, returning the removed messages
+        """
+        removed = [self._messages.pop(s) for s in schemas if s in self._messages]
+        if removed:
+            self._bindings = {}
+            for m in self._messages.values():
+                self._bindings.update(m.payload)
+            self._view = None
+        for sub in self.flatten_subs():
+            removed.extend(sub.remove(*schemas))
+        return removed
+
     @property
     def bindings(self):
-        """Return all parameters bound directly in this context or its ancestors"""
-        # may not be efficient enough, since it collects all of the
-        # bindings every time it's accessed
-        if self.parent:
-            return {**self.parent.bindings, **self._bindings}
-        else:
-            return self._bindings.copy()
+        """
+        Return all parameters bound directly in this context or its ancestors.
+
+        The merged view is cached, and rebuilt only after this context is
+        added to or an ancestor's view is replaced, so repeated lookups cost a
+        walk up the parent chain instead of a copy of every binding.  The
+        returned dict is shared; treat it as read-only.
+        """
+        base = self.parent.bindings if self.parent else None
+        if self._view is None or self._base is not base:
+            self._base = base
+            if base is None:
+                self._view = self._bindings.copy()
+            else:
+                self._view = {**base, **self._bindings}
+        return self._view
 
     def _all_bindings(self):
         """
@@ -123,24 +163,155 @@ class Context:
         yield self
         yield from self.flatten_subs()
 
+    def flatten_all(self):
+        """Yield this context and all of its descendants"""
+        yield self
+        for sub in self.flatten_subs():
+            yield from sub.flatten_all()
+
+
+class Tombstone(Context):
+    """
+    The remains of an evicted enactment: its merged bindings and a hash of
+    each message payload in it, which is enough to answer duplicate and
+    integrity checks.  Messages that arrive later are folded in the same way.
+    """
+
+    def __init__(self, context=None):
+        super().__init__()
+        self.hashes = {}
+        if context is not None:
+            self._bindings = dict(context.bindings)
+            for c in context.flatten_all():
+                for m in c._messages.values():
+                    self.hashes[fingerprint(m)] = payload_hash(m)
+
+    def add(self, message):
+        self._bindings.update(message.payload)
+        self.hashes[fingerprint(message)] = payload_hash(message)
+        self._view = None
+
+    def __repr__(self):
+        return f"Tombstone(bindings={self.bindings})"
+
 
 class Store:
-    def __init__(self, systems):
+    def __init__(
+        self, systems, index=False, dedup=False, retention=None, journal=None
+    ):
         """
         Construct a store, with separate contexts for each of the system IDs in `systems`.
+
+        index: maintain a secondary index of messages by schema, for queries
+          through messages(); see also add_index
+        dedup: remember each stored message by key, so that is_duplicate
+          can answer without walking the context tree
+        retention: a Retention policy for evicting completed enactments
+        journal: a Journal for logging added messages durably; see commit
         """
+        self.systems = systems
         # message indexes
         # recursive (key -> value -> context -> subkey -> value -> subcontext...)
         self.contexts = {k: Context() for k in systems}
+        # secondary indexes; entries map id(message) -> (message, context)
+        self.by_schema = {} if index else None  # schema -> entries
+        self.by_value = {}  # parameter -> value -> entries
+        self.unhashable = {}  # parameter -> entries with unhashable values
+        # (system, schema, key values) -> stored message, or the tombstone it
+        # was evicted into, for is_duplicate
+        self.seen = {} if dedup else None
+        self.retention = retention
+        self.journal = journal
+        self.tombstones = 0
+
+    def add_index(self, parameter):
+        """
+        Maintain an index of messages by their value for parameter, and
+        use it for queries like messages(parameter=value).
+        """
+        if not any(
+            parameter in s["protocol"].all_parameters for s in self.systems.values()
+        ):
+            raise Exception(f"Parameter {parameter} is not declared by any protocol")
+        if parameter in self.by_value:
+            return
+        self.by_value[parameter] = {}
+        self.unhashable[parameter] = {}
+        for system, root in self.contexts.items():
+            for context in root.flatten_all():
+                for m in context._messages.values():
+                    self._index_value(parameter, m, context)
+
+    def _index_value(self, parameter, message, context):
+        if parameter not in message.payload:
+            return
+        value = message.payload[parameter]
+        try:
+            entries = self.by_value[parameter].setdefault(value, {})
+        except TypeError:
+            entries = self.unhashable[parameter]
+        entries[id(message)] = (message, context)
+
+    def _index(self, message, context):
+        if self.by_schema is not None:
+            entries = self.by_schema.setdefault(message.schema, {})
+            entries[id(message)] = (message, context)
+        for p in self.by_value:
+            self._index_value(p, message, context)
+
+    def _unindex(self, message):
+        if self.by_schema is not None:
+            self.by_schema.get(message.schema, {}).pop(id(message), None)
+        for p, values in self.by_value.items():
+            if p in message.payload:
+                self.unhashable[p].pop(id(message), None)
+                try:
+                    entries = values.get(message.payload[p])
+                except TypeError:
+                    continue
+                if entries is not None:
+                    entries.pop(id(message), None)
+                    if not entries:
+                        del values[message.payload[p]]
+
+    def _candidates(self, schema, kwargs):
+        """Select the smallest index that applies to a query, if any"""
+        candidates = None
+        if schema and self.by_schema is not None:
+            candidates = self.by_schema.get(schema, {})
+        for k, test in kwargs.items():
+            if k not in self.by_value or type(test) == types.FunctionType:
+                continue
+            try:
+                entries = self.by_value[k].get(test, {})
+            except TypeError:
+                continue
+            if self.unhashable[k]:
+                entries = {**entries, **self.unhashable[k]}
+            if candidates is None or len(entries) < len(candidates):
+                candidates = entries
+        return candidates
 
     def messages(self, *args, **kwargs):
-        for c in self.contexts.values():
-            yield from c.all_messages(*args, **kwargs)
+        schema = args[0] if args else kwargs.pop("schema", None)
+        candidates = self._candidates(schema, kwargs)
+        if candidates is None:
+            for c in self.contexts.values():
+                yield from c.all_messages(schema, **kwargs)
+            return
+
+        for m, context in list(candidates.values()):
+            if (
+                context._messages.get(m.schema) is m
+                and (not schema or m.schema == schema)
+                and all(check(m[k], kwargs[k]) for k in kwargs)
+            ):
+                yield m
 
     def matching_contexts(self, message):
         """Find contexts that either have the same bindings, or don't have the parameter"""
 
-        context = self.context(message)
+        context = self.lookup(message)
 
         if len(context.subcontexts):
             return [
@@ -161,7 +332,7 @@ class Store:
         Each message in context should have the same keys.
         Returns true if the parameters are consistent with all messages in the matching context.
         """
-        context = context or self.context(message)
+        context = context or self.lookup(message)
         result = all(
             message.payload[p] == context.bindings[p]
             for p in message.payload
@@ -211,7 +382,7 @@ class Store:
         # message assumed not to be duplicate; otherwise recheck unnecessary
         parameters = {}
         for message in messages:
-            context = use_context or self.context(message)
+            context = use_context or self.lookup(message)
             if not self.check_outs(message.schema, context):
                 logger.info(
                     f"Failed {message.schema.name} out check: {message.payload}"
@@ -260,8 +431,97 @@ class Store:
 
         # log under the correct context
         for m in messages:
+            if self.journal:
+                self.journal.append(m)
             context = self.context(m)
-            context.add(m)
+            if isinstance(context, Tombstone):
+                context.add(m)
+                if self.seen is not None:
+                    self.seen[fingerprint(m)] = context
+                continue
+            if self.seen is not None:
+                self.seen[fingerprint(m)] = m
+            if self.by_schema is not None or self.by_value:
+                previous = context._messages.get(m.schema)
+                if previous is not None:
+                    self._unindex(previous)
+                context.add(m)
+                self._index(m, context)
+            else:
+                context.add(m)
+            if self.retention:
+                self.check_completion(m, context)
+
+    def commit(self):
+        """Make messages added since the last commit durable, if journaled"""
+        if self.journal:
+            self.journal.commit(self)
+
+    def walk(self, context, path=()):
+        """Yield (path, context) for context and its descendants, stopping at tombstones"""
+        yield path, context
+        if isinstance(context, Tombstone):
+            return
+        for k in context.subcontexts:
+            for v, sub in context.subcontexts[k].items():
+                yield from self.walk(sub, path + ((k, v),))
+
+    def restore_tombstone(self, system, path, bindings, keys):
+        """
+        Place a tombstone at path, as recorded in a snapshot.
+
+        keys: (schema, key values) for each message folded into the tombstone
+        """
+        node = self.contexts[system]
+        parent = None
+        for k, v in path[:-1]:
+            values = node.subcontexts.setdefault(k, {})
+            if v not in values:
+                values[v] = Context(parent=parent)
+            node = parent = values[v]
+        tombstone = Tombstone()
+        tombstone._bindings = dict(bindings)
+        for schema, key in keys:
+            # payload hashes are not stable across processes; is_duplicate
+            # treats an unknown hash as a duplicate
+            tombstone.hashes[(system, schema, key)] = None
+            if self.seen is not None:
+                self.seen[(system, schema, key)] = tombstone
+        k, v = path[-1]
+        node.subcontexts.setdefault(k, {})[v] = tombstone
+        self.tombstones += 1
+        return tombstone
+
+    def check_completion(self, message, context):
+        """Report the context to the retention policy if its enactment is complete"""
+        outs = self.systems[message.system]["protocol"].outs
+        bindings = context.bindings
+        if all(p in bindings for p in outs):
+            path = tuple((k, message.payload.get(k)) for k in message.schema.keys)
+            self.retention.complete(self, message.system, path, context)
+
+    def evict(self, system, path, context):
+        """Replace the context at path with a tombstone"""
+        node = self.contexts[system]
+        for k, v in path[:-1]:
+            node = node.subcontexts.get(k, {}).get(v)
+            if node is None or isinstance(node, Tombstone):
+                return
+        if not path:
+            return
+        k, v = path[-1]
+        if node.subcontexts.get(k, {}).get(v) is not context:
+            return
+        tombstone = Tombstone(context)
+        node.subcontexts[k][v] = tombstone
+        self.tombstones += 1
+        for c in context.flatten_all():
+            for m in c._messages.values():
+                self._unindex(m)
+                if self.seen is not None:
+                    # keep the key, so only evicted keys need the tombstone's hashes
+                    self.seen[fingerprint(m)] = tombstone
+        return tombstone
 
     def context(self, message, schema=None):
         """Find or create a context for message"""
@@ -270,6 +530,9 @@ class Store:
         if not schema:
             schema = message.schema
         for k in schema.keys:
+            if isinstance(context, Tombstone):
+                # evicted enactments absorb everything beneath them
+                break
             v = message.payload.get(k)
             if k in context:
                 if v is not None and v in context[k]:
@@ -284,12 +547,66 @@ class Store:
 
         return context
 
+    def lookup(self, message, schema=None):
+        """
+        Find the context for message without modifying the store.
+
+        Returns the stored context if it exists; otherwise a detached, empty
+        context equivalent to the one context() would create, so checks
+        against it see the same bindings.
+        """
+        parent = None
+        context = self.contexts[message.system]
+        if not schema:
+            schema = message.schema
+        for k in schema.keys:
+            if isinstance(context, Tombstone):
+                break
+            v = message.payload.get(k)
+            values = context.subcontexts.get(k)
+            if v is not None and values is not None and v in values:
+                context = values[v]
+            else:
+                return Context(parent=parent)
+            parent = context
+
+        return context
+
     def is_duplicate(self, message):
         """
         Return true if payload has already been stored.
         """
-        context = self.context(message)
-        match = context._messages.get(message.schema)
+        context = None
+        if self.seen is not None:
+            try:
+                seen = self.seen.get(fingerprint(message), False)
+            except TypeError:
+                seen = None
+            if seen is False:
+                # nothing has been stored under this key, even before an eviction
+                return False
+            if isinstance(seen, Message):
+                return self._match(message, seen)
+            context = seen
+
+        if context is None:
+            context = self.lookup(message)
+        if isinstance(context, Tombstone):
+            # evicted payloads are gone, so only their hashes can be compared
+            h = context.hashes.get(fingerprint(message), False)
+            if h is False:
+                return False
+            elif h is None or h == payload_hash(message):
+                return True
+            raise Exception(
+                "Message found with matching key {} but different parameters: {}".format(
+                    message.key, message
+                )
+            )
+        return self._match(message, context._messages.get(message.schema))
+
+    def _match(self, message, match):
+        """Whether message duplicates the stored message match, which must not conflict with it"""
         if match and match == message:
             return True
         elif match:
@@ -302,7 +619,7 @@ class Store:
             return False
 
     def fill(self, message):
-        context = self.context(message)
+        context = self.lookup(message)
         bindings = context.bindings
 
         for p in message.schema.parameters:
@@ -313,4 +630,5 @@ class Store:
                 raise Exception(
                     f"Cannot complete message {message} with context {context}"
                 )
+        message.rekey()
         return message
@@ -0,0 +1,72 @@
+from collections import deque
+from bspl.parsers.bspl import parse
+from bspl.adapter import Adapter
+from bspl.adapter.codec import Codec
+from bspl.adapter.emitter import MockEmitter, Bundle, encode
+
+specification = parse(
+    """
+RFQ {
+  roles C, S // Customer, Seller
+  parameters out item key, out ship
+  private price, payment
+
+  C -> S: req[out item]
+  S -> C: quote[in item, out price]
+  C -> S: pay[in item, in price, out payment]
+  S -> C: ship[in item, in payment, out ship]
+}
+"""
+)
+rfq = specification.export("RFQ")
+from RFQ import C, S, req, quote, pay, ship
+
+systems = {0: {"protocol": rfq, "roles": {C: "C", S: "S"}}}
+agents = {"C": [("localhost", 8001)], "S": [("localhost", 8002)]}
+
+a = Adapter("S", systems, agents, emitter=MockEmitter())  # for injection
+
+
+def test_codec_roundtrip():
+    codec = Codec(systems)
+    values = ["ball", 0, -3, 2**40, 1.5, None, True, ["nested", {"x": 1}]]
+    for v in values:
+        m = quote(item="ball", price=v, system=0)
+        (data,) = codec.decode(b"[" + codec.encode(m) + b"]")
+        assert data == m.serialize()
+
+    # unbound parameters stay unbound
+    m = pay(item="ball", system=0)
+    (data,) = codec.decode(b"[" + codec.encode(m) + b"]")
+    assert data["payload"] == {"item": "ball"}
+
+
+def test_codec_bundle():
+    codec = Codec(systems)
+    messages = [quote(item=i, price=i * 10, system=0) for i in range(100)]
+    encoded = [codec.encode(m) for m in messages]
+    assert sum(map(len, encoded)) * 3 < sum(len(encode(m)) for m in messages)
+
+    queue = deque(encoded)
+    decoded = []
+    while queue:
+        decoded.extend(codec.decode(Bundle(1500).pack(queue)))
+    assert decoded == [m.serialize() for m in messages]
+
+
+def test_json_codec():
+    import json
+
+    for m in [
+        quote(item="ball", price=10, system=0),
+        quote(item="bäll", price=1.5, system=0),
+        pay(item="ball", price=None, system=0),
+    ]:
+        assert json.loads(quote.encoder(m)) == json.loads(json.dumps(m.serialize()))
+        assert json.loads(encode(m)) == m.serialize()
+
+    m = quote(item="ball", price=10, system=0)
+    m.meta["sent"] = 5
+    decoded = quote.decoder(json.loads(quote.encoder(m)))
+    assert decoded == m
+    assert decoded.meta == {"system": 0, "sent": 5}
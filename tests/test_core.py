@@ -85,6 +85,36 @@ async def test_receive_process(systems, agents, req):
     print(f"messages: {a.history.messages()}")
 
 
+@pytest.mark.asyncio
+async def test_receive_many(systems, agents, req):
+    a = Adapter("S", systems, agents, emitter=MockEmitter(), receiver=MockReceiver())
+    batch = [req(item=i).serialize() for i in range(3)]
+    # duplicates within the batch are dropped
+    await a.receive_many(batch + [req(item=0).serialize()])
+    assert len(list(a.history.messages())) == 3
+    assert a.events.qsize() == 1
+    event = await a.events.get()
+    assert event.type == "reception" and len(event.messages) == 3
+
+
+@pytest.mark.asyncio
+async def test_receive_many_rejects(systems, agents, req, quote):
+    a = Adapter("S", systems, agents, emitter=MockEmitter(), receiver=MockReceiver())
+    batch = [
+        req(item=1).serialize(),
+        {"schema": "Unknown", "payload": {}, "meta": {}},
+        quote(item=1, price=10).serialize(),
+        # conflicts with the quote before it
+        quote(item=1, price=20).serialize(),
+        req(item=2).serialize(),
+    ]
+    # bad messages don't stop the rest of the batch
+    await a.receive_many(batch)
+    event = await a.events.get()
+    assert len(event.messages) == 3
+    assert len(list(a.history.messages())) == 3
+
+
 @pytest.mark.asyncio
 async def test_send(systems, agents, req):
     # Create the adapter with mock network components to avoid binding to real ports
@@ -126,3 +156,159 @@ async def test_enabled_initiators(systems, agents, req):
     print(list(a.enabled_messages.messages()))
     assert len(list(a.enabled_messages.messages())) == 1
     assert next(a.enabled_messages.messages()).schema == req
+
+
+def test_dependents_index(RFQ, systems, agents, req, quote, ship):
+    a = Adapter("S", systems, agents, emitter=MockEmitter(), receiver=MockReceiver())
+    # S sends quote and ship, both of which use item
+    assert set(a.dependents[req]) == {quote, ship}
+    # ship does not use price, but quote does
+    assert set(a.dependents[quote]) == {quote, ship}
+
+
+@pytest.mark.asyncio
+async def test_compute_enabled(systems, agents, req, quote):
+    a = Adapter("S", systems, agents, emitter=MockEmitter(), receiver=MockReceiver())
+    m = req(item="ball")
+    a.history.add(m)
+    update = a.compute_enabled([m])
+    assert {e.schema for e in update["added"]} == {quote}
+    assert next(a.enabled_messages.messages()).schema == quote
+
+    # quoting disables the enabled quote
+    q = quote(item="ball", price=10)
+    a.history.add(q)
+    update = a.compute_enabled([q])
+    assert not update["added"]
+    assert {e.schema for e in update["removed"]} == {quote}
+    assert not list(a.enabled_messages.messages())
+
+
+@pytest.mark.asyncio
+async def test_fan_out():
+    protocol = bspl.parsers.bspl.parse(
+        """
+Broadcast {
+  roles A, B, C
+  parameters out id key, out news
+
+  A -> B, C: announce[out id, out news]
+}
+"""
+    ).protocols["Broadcast"]
+    A, B, C = (protocol.roles[r] for r in "ABC")
+    systems = {0: {"protocol": protocol, "roles": {A: "A", B: "B", C: "C"}}}
+    agents = {
+        "A": [("localhost", 8001)],
+        "B": [("localhost", 8002)],
+        "C": [("localhost", 8003)],
+    }
+    encoded = []
+
+    def encode(m):
+        encoded.append(m)
+        return b"{}"
+
+    emitter = MockEmitter(encoder=encode)
+    a = Adapter("A", systems, agents, emitter=emitter, receiver=MockReceiver())
+    announce = protocol.messages["announce"]
+    await a.send(announce(id=1, news="hi"))
+
+    assert sorted(m.dest for m in emitter.sent_messages) == [
+        ("localhost", 8002),
+        ("localhost", 8003),
+    ]
+    # the copies share one payload, encoded once
+    first, second = emitter.sent_messages
+    assert first.payload is second.payload
+    assert len(encoded) == 1
+    assert len(list(a.history.messages())) == 1
+
+
+@pytest.mark.asyncio
+async def test_decision_dispatch(systems, agents, req, quote):
+    a = Adapter("S", systems, agents, emitter=MockEmitter(), receiver=MockReceiver())
+    calls = []
+
+    @a.decision(event=InitEvent)
+    async def init(enabled):
+        calls.append("init")
+
+    @a.decision(received=req)
+    async def on_req(enabled, event):
+        calls.append(("req", sorted(m["item"] for m in event["observations"])))
+
+    @a.decision(received=quote)
+    async def on_quote(enabled):
+        calls.append("quote")
+
+    @a.decision
+    async def always(enabled):
+        calls.append("always")
+
+    # only handlers that can fire for the event are considered
+    assert [e[1] for e in a.dispatch(InitEvent())] == [init, always]
+
+    await a.process(InitEvent())
+    assert calls == ["init", "always"]
+
+    calls.clear()
+    await a.receive_many([req(item="ball").serialize(), req(item="bat").serialize()])
+    await a.process(await a.events.get())
+    assert calls == [("req", ["ball", "bat"]), "always"]
+
+
+@pytest.mark.asyncio
+async def test_generator_index(systems, agents, req, quote, ship):
+    a = Adapter("S", systems, agents, emitter=MockEmitter(), receiver=MockReceiver())
+    calls = []
+
+    @a.enabled(quote)
+    async def send_quote(msg):
+        calls.append(msg["item"])
+        return msg.bind(price=10)
+
+    @a.enabled(ship)
+    async def send_ship(msg):
+        calls.append("ship")
+
+    # quote and ship both depend on req
+    assert a.generators_for(req) == [(quote,), (ship,)]
+
+    m = req(item="ball")
+    await a.receive(m.serialize())
+    await a.process(await a.events.get())
+    assert calls == ["ball"]
+    assert [s.schema for s in a.emitter.sent_messages] == [quote]
+
+
+@pytest.mark.asyncio
+async def test_coalesced_update(systems, agents, req, quote):
+    emitter = MockEmitter()
+    a = Adapter(
+        "S", systems, agents, emitter=emitter, receiver=MockReceiver(), coalesce=True
+    )
+    calls = []
+    updates = []
+
+    @a.decision(received=req)
+    async def quote_all(enabled, event):
+        calls.append(sorted(m["item"] for m in event["observations"]))
+        return [m.bind(price=10) for m in enabled.messages() if m.schema == quote]
+
+    original = a.compute_enabled
+
+    def compute_enabled(observations):
+        updates.append(len(observations))
+        return original(observations)
+
+    a.compute_enabled = compute_enabled
+
+    await a.receive(req(item="ball").serialize())
+    await a.receive(req(item="bat").serialize())
+    await a.update()
+    # both receptions are handled in one step, and their quotes sent together
+    assert updates == [2]
+    assert calls == [["ball", "bat"]]
+    assert sorted(m["item"] for m in emitter.sent_messages) == ["ball", "bat"]
+    assert a.events.qsize() == 1
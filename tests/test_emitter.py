@@ -1,6 +1,7 @@
 from bspl.parsers.bspl import parse
-from bspl.adapter.emitter import Bundle
+from bspl.adapter.emitter import Bundle, BundlingEmitter, DatagramSender
 from collections import deque
+import asyncio
 import pytest
 
 specification = parse(
@@ -51,3 +52,270 @@ def test_bundle():
     queue = deque([b"a" * 1500])
     with pytest.raises(Exception):
         b.pack(queue)
+
+
+class Packet:
+    def __init__(self, data, dest=("localhost", 8001)):
+        self.data = data
+        self.dest = dest
+        self.payload = {}
+        self.schema = self.system = None
+
+
+class Recorder(BundlingEmitter):
+    def __init__(self, **kwargs):
+        super().__init__(encoder=lambda m: m.data, **kwargs)
+        self.packets = []
+
+    def transmit(self, packet, dest):
+        self.packets.append(packet)
+        super().transmit(packet, ("localhost", 9))
+
+
+@pytest.mark.asyncio
+async def test_bundling_emitter():
+    e = Recorder(mtu=12)
+    await e.task()
+    await e.bulk_send([Packet(b"aa"), Packet(b"bb"), Packet(b"cc")])
+    assert not e.packets
+    await asyncio.sleep(0)
+    assert e.packets == [b"[aa,bb,cc]"]
+
+    # full packets go out without waiting
+    await e.bulk_send([Packet(b"ddd"), Packet(b"eee"), Packet(b"fff")])
+    assert e.packets[1:] == [b"[ddd,eee]"]
+    await asyncio.sleep(0)
+    assert e.packets[2:] == [b"[fff]"]
+    assert 0 < e.stats["fill"] < 1
+    await e.stop()
+
+
+@pytest.mark.asyncio
+async def test_bundling_delay():
+    e = Recorder(mtu=1000, delay=0.01)
+    await e.task()
+    await e.send(Packet(b"a"))
+    await asyncio.sleep(0)
+    await e.send(Packet(b"b"))
+    assert not e.packets
+    await asyncio.sleep(0.02)
+    assert e.packets == [b"[a,b]"]
+    await e.stop()
+
+
+class Collector:
+    def __init__(self):
+        self.received = []
+
+    async def receive_many(self, batch):
+        self.received.extend(batch)
+
+    def debug(self, msg):
+        pass
+
+
+def free_port():
+    import socket
+
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+@pytest.mark.asyncio
+async def test_stream_transport():
+    from bspl.adapter.emitter import StreamEmitter
+    from bspl.adapter.receiver import StreamReceiver
+
+    address = ("localhost", free_port())
+    e = StreamEmitter(encoder=lambda m: m.data, limit=10, backoff=0.01)
+    await e.task()
+    # queued messages wait for the receiver to come up
+    await e.bulk_send([Packet(b'{"n":%d}' % i, address) for i in range(5)])
+
+    collector = Collector()
+    r = StreamReceiver(address)
+    await asyncio.sleep(0.05)
+    await r.task(collector)
+    # more than the queue limit, so send has to wait for the writer
+    await e.bulk_send([Packet(b'{"n":%d}' % i, address) for i in range(5, 100)])
+    for _ in range(100):
+        if len(collector.received) == 100:
+            break
+        await asyncio.sleep(0.01)
+    assert collector.received == [{"n": i} for i in range(100)]
+    assert e.stats["packets"] == 100
+    assert e.stats["reconnects"] > 0
+    await e.stop()
+    await r.stop()
+
+
+@pytest.mark.asyncio
+async def test_stream_max_frame():
+    from bspl.adapter.receiver import StreamReceiver
+
+    address = ("localhost", free_port())
+    collector = Collector()
+    r = StreamReceiver(address, max_frame=100)
+    await r.task(collector)
+    reader, writer = await asyncio.open_connection(*address)
+    frame = b'{"n":1}'
+    writer.write(len(frame).to_bytes(4, "big") + frame)
+    # a corrupt length prefix closes the connection
+    writer.write((2**31).to_bytes(4, "big") + b"x" * 10)
+    await writer.drain()
+    assert await asyncio.wait_for(reader.read(), 1) == b""
+    assert collector.received == [{"n": 1}]
+    writer.close()
+    await r.stop()
+
+
+@pytest.mark.asyncio
+async def test_unix_transport(tmp_path):
+    from bspl.adapter.emitter import UnixEmitter, UnixStreamEmitter
+    from bspl.adapter.receiver import UnixReceiver, UnixStreamReceiver
+
+    path = str(tmp_path / "dgram.sock")
+    collector = Collector()
+    r = UnixReceiver(path)
+    await r.task(collector)
+    e = UnixEmitter(encoder=lambda m: m.data)
+    # larger than a UDP datagram could carry
+    big = b'{"n":"' + b"x" * 5000 + b'"}'
+    await e.bulk_send([Packet(b'{"n":1}', path), Packet(big, path)])
+    await asyncio.sleep(0.01)
+    assert collector.received == [{"n": 1}, {"n": "x" * 5000}]
+    assert e.stats["packets"] == 1
+    await r.stop()
+    await e.stop()
+
+    path = tmp_path / "stream.sock"
+    collector = Collector()
+    r = UnixStreamReceiver(path)
+    await r.task(collector)
+    e = UnixStreamEmitter(encoder=lambda m: m.data)
+    await e.task()
+    await e.send(Packet(b'{"n":2}', path))
+    await asyncio.sleep(0.01)
+    assert collector.received == [{"n": 2}]
+    await e.stop()
+    await r.stop()
+
+
+class Transport:
+    def __init__(self):
+        self.sent = []
+
+    def sendto(self, packet, dest):
+        self.sent.append((packet, dest))
+
+    def close(self):
+        pass
+
+
+def test_datagram_flow_control():
+    stats = {}
+    sender = DatagramSender(stats, overflow=2)
+    sender.transport = Transport()
+    a, b = ("localhost", 8001), ("localhost", 8002)
+    assert sender.sendto(b"1", a)
+
+    sender.pause_writing()
+    assert sender.sendto(b"2", a) and sender.sendto(b"3", a)
+    assert not sender.sendto(b"4", a)
+    assert sender.sendto(b"5", b)
+    assert stats == {"deferred": 3, "dropped": 1}
+
+    sender.resume_writing()
+    assert sender.transport.sent == [(b"1", a), (b"2", a), (b"5", b), (b"3", a)]
+    assert not sender.backlog
+    sender.close()
+
+
+@pytest.mark.asyncio
+async def test_datagram_transport():
+    import socket
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(("localhost", 0))
+        dest = s.getsockname()
+        e = BundlingEmitter(encoder=lambda m: m.data)
+        await e.task()
+        await e.bulk_send([Packet(b"1", dest), Packet(b"2", dest)])
+        await asyncio.sleep(0.01)
+        assert s.recv(1500) == b"[1,2]"
+        await e.stop()
+
+
+@pytest.mark.asyncio
+async def test_mixed_transport(tmp_path):
+    import socket
+    from bspl.adapter.core import default_emitter
+    from bspl.adapter.emitter import Emitter, MixedEmitter, UnixEmitter
+    from bspl.adapter.receiver import UnixReceiver
+
+    path = str(tmp_path / "dgram.sock")
+    collector = Collector()
+    r = UnixReceiver(path)
+    await r.task(collector)
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(("localhost", 0))
+        dest = s.getsockname()
+
+        # a path is dropped without breaking the UDP transport
+        e = Emitter(encoder=lambda m: m.data)
+        await e.task()
+        await e.send(Packet(b'{"n":1}', path))
+        await e.send(Packet(b'{"n":2}', dest))
+        await asyncio.sleep(0.01)
+        assert s.recv(1500) == b'[{"n":2}]'
+        assert e.stats["dropped"] == 1
+        await e.stop()
+
+        e = MixedEmitter(encoder=lambda m: m.data)
+        await e.task()
+        await e.bulk_send([Packet(b'{"n":3}', path), Packet(b'{"n":4}', dest)])
+        await asyncio.sleep(0.01)
+        assert s.recv(1500) == b'[{"n":4}]'
+        assert collector.received == [{"n": 3}]
+        assert e.stats["packets"] == 2
+        await e.stop()
+    await r.stop()
+
+    assert isinstance(default_emitter({"A": [dest], "B": path}), MixedEmitter)
+    assert isinstance(default_emitter({"A": [path]}), UnixEmitter)
+    assert type(default_emitter({"A": [dest]})) is Emitter
+
+
+@pytest.mark.asyncio
+async def test_datagram_connection_lost():
+    import socket
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(("localhost", 0))
+        dest = s.getsockname()
+        stats = {}
+        sender = DatagramSender(stats)
+        await sender.start()
+        transport = sender.transport
+        transport.abort()
+        await asyncio.sleep(0.01)
+        assert sender.transport not in (None, transport)
+        assert stats["dropped"] == 1
+        assert sender.sendto(b"1", dest)
+        await asyncio.sleep(0.01)
+        assert s.recv(1500) == b"1"
+        sender.close()
+        await asyncio.sleep(0.01)
+        assert sender.transport is None
+
+
+def test_receiver_limit():
+    from bspl.adapter.receiver import UDPReceiverProtocol
+
+    stats = {"dropped": 0}
+    protocol = UDPReceiverProtocol(asyncio.Queue(2), None, stats)
+    for i in range(3):
+        protocol.datagram_received(b"[]", None)
+    assert protocol.queue.qsize() == 2
+    assert stats["dropped"] == 1
@@ -0,0 +1,118 @@
+import asyncio
+import pytest
+import bspl.parsers.bspl
+from bspl.adapter import Adapter
+from bspl.adapter.emitter import MockEmitter
+from bspl.adapter.receiver import MockReceiver
+from bspl.adapter.lanes import Lanes
+
+
+@pytest.fixture(scope="module")
+def RFQ():
+    return bspl.parsers.bspl.parse(
+        """
+RFQ {
+  roles C, S
+  parameters out item key, out price
+
+  C -> S: req[out item]
+  S -> C: quote[in item, out price]
+}
+"""
+    ).protocols["RFQ"]
+
+
+@pytest.fixture(scope="module")
+def systems(RFQ):
+    C, S = RFQ.roles["C"], RFQ.roles["S"]
+    return {0: {"protocol": RFQ, "roles": {C: "C", S: "S"}}}
+
+
+@pytest.fixture(scope="module")
+def agents():
+    return {"C": [("localhost", 8001)], "S": [("localhost", 8002)]}
+
+
+@pytest.mark.asyncio
+async def test_order():
+    lanes = Lanes(limit=2)
+    log = []
+
+    async def handler(name, delay):
+        await asyncio.sleep(delay)
+        log.append(name)
+
+    await lanes.submit(["a"], handler, "a1", 0.02)
+    await lanes.submit(["b"], handler, "b1", 0)
+    # waits for a slot, then runs after a1
+    await lanes.submit(["a"], handler, "a2", 0)
+    assert lanes.stats["max in flight"] == 2
+    await lanes.join()
+    assert log == ["b1", "a1", "a2"]
+    assert not lanes.lanes
+
+
+@pytest.mark.asyncio
+async def test_concurrent_reactors(RFQ, systems, agents):
+    emitter = MockEmitter()
+    a = Adapter(
+        "S", systems, agents, emitter=emitter, receiver=MockReceiver(), concurrency=10
+    )
+    req, quote = RFQ.messages["req"], RFQ.messages["quote"]
+    log = []
+    ball = asyncio.Event()
+
+    @a.reaction(req)
+    async def store(message):
+        if message["item"] == "ball":
+            # a slow reactor for one enactment doesn't hold up the others
+            await ball.wait()
+        log.append(message["item"])
+
+    @a.decision(received=req)
+    async def decide(enabled):
+        return [m.bind(price=10) for m in enabled.messages() if m.schema == quote]
+
+    await a.receive(req(item="ball").serialize())
+    await a.update()
+    await a.receive(req(item="bat").serialize())
+    await a.update()
+    await asyncio.sleep(0.01)
+    assert log == ["bat"]
+
+    # the decision for ball waits for its reactor
+    ball.set()
+    await a.lanes.join()
+    assert log == ["bat", "ball"]
+    assert sorted(m["item"] for m in emitter.sent_messages) == ["ball", "bat"]
+
+
+@pytest.mark.asyncio
+async def test_generators_follow_reactors(RFQ, systems, agents):
+    emitter = MockEmitter()
+    a = Adapter(
+        "S", systems, agents, emitter=emitter, receiver=MockReceiver(), concurrency=10
+    )
+    req, quote = RFQ.messages["req"], RFQ.messages["quote"]
+    log = []
+    stored = asyncio.Event()
+
+    @a.reaction(req)
+    async def store(message):
+        await stored.wait()
+        log.append("reactor")
+
+    @a.enabled(quote)
+    async def send_quote(msg):
+        log.append("generator")
+        return msg.bind(price=10)
+
+    await a.receive(req(item="ball").serialize())
+    await a.update()
+    await asyncio.sleep(0.01)
+    # the generator waits for the enactment's reactor
+    assert log == []
+    stored.set()
+    await a.lanes.join()
+    assert log == ["reactor", "generator"]
+    assert [m.schema for m in emitter.sent_messages] == [quote]
@@ -0,0 +1,87 @@
+import asyncio
+import pytest
+from bspl.parsers.bspl import parse
+from bspl.adapter import Adapter
+from bspl.adapter.loopback import LoopbackEmitter, LoopbackReceiver
+
+specification_text = """
+RFQ {
+  roles C, S // Customer, Seller
+  parameters out item key, out price
+
+  C -> S: req[out item]
+  S -> C: quote[in item, out price]
+}
+"""
+specification = parse(specification_text)
+rfq = specification.export("RFQ")
+from RFQ import C, S, req, quote
+
+systems = {0: {"protocol": rfq, "roles": {C: "C", S: "S"}}}
+agents = {"C": [("localhost", 8001)], "S": [("localhost", 8002)]}
+
+
+@pytest.mark.asyncio
+async def test_loopback():
+    network = {}
+    adapters = {}
+    for name in agents:
+        adapters[name] = Adapter(
+            name,
+            systems,
+            agents,
+            emitter=LoopbackEmitter(network),
+            receiver=LoopbackReceiver(agents[name][0], network),
+        )
+        await adapters[name].receivers[0].task(adapters[name])
+    c, s = adapters["C"], adapters["S"]
+
+    await c.send(req(item="ball", system=0))
+    await asyncio.sleep(0)
+    (m,) = s.history.messages()
+    assert m == req(item="ball", system=0)
+    # the payload is shared, but each adapter has its own message
+    (sent,) = c.history.messages()
+    assert m is not sent and m.payload is sent.payload
+    assert "received" in m.meta and "received" not in sent.meta
+
+    await s.receivers[0].stop()
+    await c.send(req(item="bat", system=0))
+    assert c.emitter.stats == {"bytes": 0, "packets": 1, "dropped": 1}
+
+
+def parse_rfq():
+    return parse(specification_text).protocols["RFQ"]
+
+
+@pytest.mark.asyncio
+async def test_separate_protocols():
+    # each adapter parses its own copy of the protocol, as separate agents do
+    network = {}
+    adapters = {}
+    for name in agents:
+        protocol = parse_rfq()
+        roles = {protocol.roles["C"]: "C", protocol.roles["S"]: "S"}
+        adapters[name] = Adapter(
+            name,
+            {0: {"protocol": protocol, "roles": roles}},
+            agents,
+            emitter=LoopbackEmitter(network),
+            receiver=LoopbackReceiver(agents[name][0], network),
+        )
+        await adapters[name].receivers[0].task(adapters[name])
+    c, s = adapters["C"], adapters["S"]
+    s_req = s.protocols[0].messages["req"]
+    fired = []
+
+    @s.reaction(s_req)
+    async def reactor(message):
+        fired.append(message["item"])
+
+    await c.send(c.protocols[0].messages["req"](item="ball", system=0))
+    await asyncio.sleep(0)
+    (m,) = s.history.messages()
+    assert m.schema is s_req
+    await s.process(await s.events.get())
+    assert fired == ["ball"]
+    assert [e.schema.name for e in s.enabled_messages.messages()] == ["quote"]
@@ -3,7 +3,7 @@
 import pytest
 import logging
 from bspl.parsers.bspl import parse
-from bspl.adapter.message import Message
+from bspl.adapter.message import Message, Record, record_class
 
 specification = parse(
     """
@@ -99,3 +99,59 @@ def test_partial_bind():
         == "Bind must produce a complete instance: pay(item='ball',price=10,payment=10){system=None}"
     )
     p.bind(payment=10, address="home")
+
+
+def test_message_slots():
+    m = Message(req, {"item": "ball"}, system=0)
+    assert not hasattr(m, "__dict__")
+    # meta is only allocated on demand
+    assert m._meta is None
+    assert m.system == 0
+    m.meta["sent"] = 1
+    assert m.meta == {"system": 0, "sent": 1}
+
+
+def test_message_key_cache():
+    m = Message(pay, {"item": "ball", "price": 10})
+    assert m.key == "item:ball"
+    h = hash(m)
+    assert hash(m) == h
+
+    # binding a key parameter invalidates the cached key
+    p = Message(req, {"item": "ball"})
+    assert p.key == "item:ball"
+    p.bind(item="bat")
+    assert p.key == "item:bat"
+    assert hash(p) == hash(Message(req, {"item": "bat"}))
+
+
+def test_payload_record():
+    record = record_class(pay)
+    r = record({"item": "ball", "price": 10})
+    assert not hasattr(r, "__dict__")
+    assert r == {"item": "ball", "price": 10}
+    assert "payment" not in r and r.get("payment") is None
+    r["payment"] = "cash"
+    assert list(r) == ["item", "price", "payment"]
+    assert r.copy() == r and r.copy() is not r
+    with pytest.raises(KeyError):
+        r["ship"] = "today"
+
+    pay.record = record
+    try:
+        m = Message(pay, {"item": "ball", "price": 10}, system=0)
+        assert isinstance(m.payload, Record)
+        assert not m.complete
+        m.bind(payment="cash", address="home")
+        assert m.complete
+        assert type(m.serialize()["payload"]) is dict
+    finally:
+        del pay.record
+
+
+def test_path_endpoint():
+    m = Message(req, {"item": "ball"})
+    m.dest = "/run/bspl/S.sock"
+    assert m.dest == "/run/bspl/S.sock"
+    m.dests = [("localhost", 8001), "/run/bspl/S.sock"]
+    assert len(m.dests) == 2
@@ -0,0 +1,127 @@
+import asyncio
+import pytest
+import bspl.parsers.bspl
+from bspl.adapter import Adapter, Scheduler
+from bspl.adapter.emitter import MockEmitter
+from bspl.adapter.receiver import MockReceiver
+from bspl.adapter.event import InitEvent, ReceptionEvent, EmissionEvent
+from bspl.adapter.overload import EventQueue
+
+
+@pytest.fixture(scope="module")
+def RFQ():
+    return bspl.parsers.bspl.parse(
+        """
+RFQ {
+  roles C, S
+  parameters out item key, out price
+
+  C -> S: req[out item]
+  S -> C: quote[in item, out price]
+}
+"""
+    ).protocols["RFQ"]
+
+
+@pytest.fixture(scope="module")
+def systems(RFQ):
+    C, S = RFQ.roles["C"], RFQ.roles["S"]
+    return {0: {"protocol": RFQ, "roles": {C: "C", S: "S"}}}
+
+
+@pytest.fixture(scope="module")
+def agents():
+    return {"C": [("localhost", 8001)], "S": [("localhost", 8002)]}
+
+
+@pytest.mark.asyncio
+async def test_order():
+    q = EventQueue(limit=2)
+    init = InitEvent()
+    r1, r2 = ReceptionEvent(), ReceptionEvent()
+    q.put_nowait(r1)
+    q.put_nowait(init)
+    assert q.get_nowait() is r1
+    assert q.get_nowait() is init
+
+    # other events wait while the queue is overloaded
+    q.put_nowait(init)
+    q.put_nowait(r1)
+    q.put_nowait(r2)
+    assert q.overloaded
+    assert q.get_nowait() is r1
+    assert q.get_nowait() is init
+    assert q.get_nowait() is r2
+    assert q.empty()
+    assert q.stats["events"] == 5
+    assert q.stats["max depth"] == 3
+
+
+@pytest.mark.asyncio
+async def test_block():
+    q = EventQueue(limit=1)
+    q.put_nowait(ReceptionEvent())
+    admitted = asyncio.ensure_future(q.admit())
+    await asyncio.sleep(0)
+    assert not admitted.done()
+    # emissions are always queued
+    await q.put(EmissionEvent([]))
+    assert q.qsize() == 2
+
+    await q.get()
+    await asyncio.sleep(0)
+    assert not admitted.done()
+    await q.get()
+    await admitted
+    assert q.stats["blocked"] == 1
+
+
+@pytest.mark.asyncio
+async def test_shed(RFQ, systems, agents):
+    q = EventQueue(limit=1, policy="shed")
+    a = Adapter(
+        "S", systems, agents, emitter=MockEmitter(), receiver=MockReceiver(), events=q
+    )
+    req = RFQ.messages["req"]
+    await a.receive(req(item="ball").serialize())
+    assert q.overloaded
+    # new messages are still admitted while overloaded
+    await a.receive_many([req(item="bat").serialize(), req(item="cap").serialize()])
+    assert q.shedding
+
+    # duplicates are dropped as always, and new messages are shed
+    await a.receive(req(item="ball").serialize())
+    await a.receive(req(item="hat").serialize())
+    assert [m["item"] for m in a.history.messages()] == ["ball", "bat", "cap"]
+    assert q.stats["shed"] == 1
+
+
+class Policy:
+    def __init__(self, key):
+        self.key = key
+        self.runs = 0
+
+    def run(self, history):
+        self.runs += 1
+        return []
+
+
+@pytest.mark.asyncio
+async def test_skip_reminders(systems, agents):
+    q = EventQueue(limit=1)
+    a = Adapter(
+        "S", systems, agents, emitter=MockEmitter(), receiver=MockReceiver(), events=q
+    )
+    remind, forward = Policy("reminders"), Policy("forwards")
+    s = Scheduler("1s")
+    s.adapter = a
+    s.add(remind).add(forward)
+
+    await s.run()
+    assert remind.runs == forward.runs == 1
+
+    # only reminders are skipped while overloaded
+    q.put_nowait(ReceptionEvent())
+    await s.run()
+    assert (remind.runs, forward.runs) == (1, 2)
+    assert q.stats["reminders shed"] == 1
@@ -0,0 +1,117 @@
+import os
+import pytest
+from bspl.parsers.bspl import parse
+from bspl.adapter import Adapter
+from bspl.adapter.emitter import MockEmitter
+from bspl.adapter.receiver import MockReceiver
+from bspl.adapter.persistence import Journal
+from bspl.adapter.retention import Retention
+from bspl.adapter.store import Store, Tombstone
+
+specification = parse(
+    """
+RFQ {
+  roles C, S // Customer, Seller
+  parameters out item key, out ship
+  private price, payment
+
+  C -> S: req[out item]
+  S -> C: quote[in item, out price]
+  C -> S: pay[in item, in price, out payment]
+  S -> C: ship[in item, in payment, out ship]
+}
+"""
+)
+rfq = specification.export("RFQ")
+from RFQ import C, S, req, quote, pay, ship
+
+systems = {0: {"protocol": rfq, "roles": {C: "C", S: "S"}}}
+agents = {"C": [("localhost", 8001)], "S": [("localhost", 8002)]}
+schemas = {m.qualified_name: m for m in rfq.messages.values()}
+
+a = Adapter("S", systems, agents, emitter=MockEmitter())  # for injection
+
+
+def test_journal_replay(tmp_path):
+    h = Store(systems, journal=Journal(tmp_path))
+    h.add(req(item="ball", system=0), quote(item="ball", price=10, system=0))
+    # nothing is durable before a commit
+    assert not Journal(tmp_path).replay(Store(systems), schemas)
+    h.commit()
+
+    restored = Store(systems)
+    messages = Journal(tmp_path).replay(restored, schemas)
+    assert len(messages) == 2
+    assert set(restored.messages()) == set(h.messages())
+
+
+def test_journal_snapshot(tmp_path):
+    journal = Journal(tmp_path, snapshot_every=2)
+    h = Store(systems, retention=Retention(count=0), journal=journal)
+    h.add(req(item="ball", system=0), quote(item="ball", price=10, system=0))
+    h.add(pay(item="ball", price=10, payment="cash", system=0))
+    h.add(ship(item="ball", payment="cash", ship="today", system=0))
+    h.add(req(item="bat", system=0))
+    h.commit()
+    assert os.path.exists(journal.snapshot_path)
+    assert os.path.getsize(journal.log_path) == 0
+
+    restored = Store(systems, dedup=True)
+    Journal(tmp_path).replay(restored, schemas)
+    assert isinstance(restored.contexts[0]["item"]["ball"], Tombstone)
+    assert restored.is_duplicate(
+        ship(item="ball", payment="cash", ship="today", system=0)
+    )
+    assert set(restored.messages()) == {req(item="bat", system=0)}
+
+
+@pytest.mark.asyncio
+async def test_adapter_restore(tmp_path):
+    s = Adapter(
+        "S",
+        systems,
+        agents,
+        emitter=MockEmitter(),
+        receiver=MockReceiver(),
+        journal=Journal(tmp_path),
+    )
+    await s.receive(req(item="ball", system=0).serialize())
+    await s.send(quote(item="ball", price=10, system=0))
+
+    restarted = Adapter(
+        "S",
+        systems,
+        agents,
+        emitter=MockEmitter(),
+        receiver=MockReceiver(),
+        journal=Journal(tmp_path),
+    )
+    assert len(list(restarted.history.messages())) == 2
+    assert restarted.history.is_duplicate(req(item="ball", system=0))
+    # nothing is enabled for a quoted item
+    assert not list(restarted.enabled_messages.messages())
+
+
+@pytest.mark.asyncio
+async def test_receptions_durable(tmp_path):
+    s = Adapter(
+        "S",
+        systems,
+        agents,
+        emitter=MockEmitter(),
+        receiver=MockReceiver(),
+        journal=Journal(tmp_path),
+    )
+    await s.receive(req(item="ball", system=0).serialize())
+    await s.receive_many([req(item=i, system=0).serialize() for i in range(50)])
+
+    # restore without stopping or sending anything
+    restarted = Adapter(
+        "S",
+        systems,
+        agents,
+        emitter=MockEmitter(),
+        receiver=MockReceiver(),
+        journal=Journal(tmp_path),
+    )
+    assert len(list(restarted.history.messages())) == 51
@@ -0,0 +1,229 @@
+import time
+import asyncio
+import multiprocessing
+import threading
+import pytest
+from bspl.parsers.bspl import parse
+from bspl.adapter import Adapter
+from bspl.adapter.emitter import MockEmitter
+from bspl.adapter.receiver import MockReceiver
+from bspl.adapter.persistence import Journal
+from bspl.adapter.store import Store
+from bspl.adapter.sharding import Shard, Router, root_key, shard_of, worker
+
+specification = parse(
+    """
+Logistics {
+  roles Merchant, Wrapper, Labeler, Packer
+  parameters out orderID key, out itemID key, out item, out status
+  private address, label, wrapping
+
+  Merchant -> Labeler: RequestLabel[out orderID key, out address]
+  Merchant -> Wrapper: RequestWrapping[in orderID key, out itemID key, out item]
+  Wrapper -> Packer: Wrapped[in orderID key, in itemID key, in item, out wrapping]
+  Labeler -> Packer: Labeled[in orderID key, in address, out label]
+  Packer -> Merchant: Packed[in orderID key, in itemID key, in wrapping, in label, out status]
+}
+"""
+)
+
+logistics = specification.export("Logistics")
+from Logistics import Merchant, Labeler, Packer, Wrapped, Labeled, RequestLabel
+from Logistics import Packed
+
+systems = {
+    0: {
+        "protocol": logistics,
+        "roles": {Packer: "P", Merchant: "M", Labeler: "L"},
+    }
+}
+
+agents = {
+    "P": [("localhost", 8001)],
+    "M": [("localhost", 8002)],
+    "L": [("localhost", 8003)],
+}
+
+
+def test_root_key():
+    assert root_key(logistics, Wrapped) == "orderID"
+    assert root_key(logistics, Labeled) == "orderID"
+
+
+def test_enactment_shares_shard():
+    for orderID in range(20):
+        label = {"orderID": orderID, "address": "home", "label": "0001"}
+        shard = shard_of(0, logistics, Labeled, label, 4)
+        for itemID in range(3):
+            wrapped = {
+                "orderID": orderID,
+                "itemID": itemID,
+                "item": "ball",
+                "wrapping": "paper",
+            }
+            assert shard_of(0, logistics, Wrapped, wrapped, 4) == shard
+
+
+@pytest.mark.asyncio
+async def test_route_forwards_foreign_messages():
+    a = Adapter("M", systems, agents, emitter=MockEmitter(), receiver=MockReceiver())
+    left, right = multiprocessing.Pipe()
+    a.shard = Shard(0, 2, left)
+
+    messages = [RequestLabel(orderID=i, address="home") for i in range(10)]
+    await a.send(*messages)
+
+    forwarded = []
+    # the writer thread sends them in the background
+    while right.poll(0.5):
+        forwarded.append(right.recv())
+    assert forwarded
+    assert all(owner == 1 for _, owner, _, _ in forwarded)
+    assert len(forwarded) + len(list(a.history.messages())) == 10
+
+
+@pytest.mark.asyncio
+async def test_router_dispatch():
+    a = Adapter("P", systems, agents, emitter=MockEmitter(), receiver=MockReceiver())
+    pipes = [multiprocessing.Pipe() for _ in range(3)]
+    router = Router(a, [p[0] for p in pipes])
+
+    m = Wrapped(orderID=1, itemID=0, item="ball", wrapping="paper", system=0)
+    await router.receive(m.serialize())
+    owner = router.owner(m.serialize())
+    kind, data, _ = pipes[owner][1].recv()
+    assert kind == "receive"
+    assert data["payload"] == m.payload
+
+
+class Stalled:
+    """Connection whose sends wait until released"""
+
+    def __init__(self):
+        self.sending = threading.Event()
+        self.release = threading.Event()
+        self.sent = []
+
+    def send(self, obj):
+        self.sending.set()
+        self.release.wait()
+        self.sent.append(obj)
+
+
+@pytest.mark.asyncio
+async def test_router_limit():
+    a = Adapter("P", systems, agents, emitter=MockEmitter(), receiver=MockReceiver())
+    connection = Stalled()
+    router = Router(a, [connection], limit=1)
+
+    messages = [
+        Wrapped(orderID=i, itemID=0, item="ball", wrapping="paper", system=0)
+        for i in range(4)
+    ]
+    await router.receive(messages[0].serialize())
+    assert connection.sending.wait(1)
+    # one more is queued behind the stalled send, and the rest are dropped
+    await router.receive(messages[1].serialize())
+    await router.receive_many([m.serialize() for m in messages[2:]])
+    assert router.stats["dropped"] == 2
+
+    connection.release.set()
+    router.writers[0].close()
+    router.writers[0].thread.join(1)
+    assert [data["payload"]["orderID"] for _, data, _ in connection.sent] == [0, 1]
+
+
+@pytest.mark.asyncio
+async def test_sharded_adapter(tmp_path):
+    context = multiprocessing.get_context("fork")
+    observed = context.Queue()
+    a = Adapter(
+        "M",
+        systems,
+        agents,
+        emitter=MockEmitter(),
+        receiver=MockReceiver(),
+        journal=Journal(tmp_path),
+    )
+    a.history.journal.sharded(2)
+
+    @a.reaction(RequestLabel, Packed)
+    async def record(message):
+        observed.put((a.shard.index, message.schema.name, message["orderID"]))
+
+    async def initiate():
+        # the first worker initiates every order, and hands the ones owned by
+        # the other worker to it
+        await a.send(
+            *[RequestLabel(orderID=i, address="home", system=0) for i in range(10)]
+        )
+
+    task = initiate()
+    connections = []
+    processes = []
+    for i in range(2):
+        parent, child = context.Pipe()
+        p = context.Process(
+            target=worker, args=(a, i, 2, child, (task,), False), daemon=True
+        )
+        p.start()
+        connections.append(parent)
+        processes.append(p)
+    task.close()
+
+    router = Router(a, connections)
+    try:
+        await router.task()
+        packed = [
+            Packed(
+                orderID=i,
+                itemID=0,
+                wrapping="paper",
+                label="0001",
+                status="ok",
+                system=0,
+            )
+            for i in range(10)
+        ]
+        await router.receive_many([m.serialize() for m in packed])
+
+        results = set()
+        deadline = time.monotonic() + 10
+        while len(results) < 20 and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            while not observed.empty():
+                results.add(observed.get())
+    finally:
+        for p in processes:
+            p.terminate()
+
+    expected = {
+        (shard_of(0, logistics, schema, {"orderID": i}, 2), schema.name, i)
+        for schema in (RequestLabel, Packed)
+        for i in range(10)
+    }
+    assert results == expected
+    # both workers took part
+    assert {index for index, _, _ in results} == {0, 1}
+
+    # each worker journaled its own slice of the history
+    schemas = {m.qualified_name: m for m in logistics.messages.values()}
+    journaled = set()
+    for i in range(2):
+        messages = Journal(tmp_path / f"shard-{i}").replay(Store(systems), schemas)
+        journaled.update((i, m.schema.name, m["orderID"]) for m in messages)
+    assert journaled == expected
+
+
+def test_sharded_journal(tmp_path):
+    Journal(tmp_path).sharded(2)
+    Journal(tmp_path).sharded(2)
+    with pytest.raises(Exception):
+        Journal(tmp_path).sharded(3)
+
+    # an unsharded history can't be split
+    h = Store(systems, journal=Journal(tmp_path / "plain"))
+    h.add(RequestLabel(orderID=1, address="home", system=0))
+    h.commit()
+    with pytest.raises(Exception):
+        Journal(tmp_path / "plain").sharded(2)
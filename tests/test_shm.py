@@ -0,0 +1,151 @@
+import asyncio
+import subprocess
+import pytest
+from bspl.adapter.shm import Ring, SharedMemoryEmitter, SharedMemoryReceiver
+
+
+class Packet:
+    def __init__(self, data, dest):
+        self.data = data
+        self.dest = dest
+        self.payload = {}
+        self.schema = self.system = None
+
+
+class Collector:
+    def __init__(self):
+        self.received = []
+
+    async def receive_many(self, batch):
+        self.received.extend(batch)
+
+    def debug(self, msg):
+        pass
+
+
+def test_ring():
+    ring = Ring.create(64)
+    records = []
+    try:
+        # enough records to wrap around several times
+        for i in range(20):
+            data = b"x" * (i % 7 + 1)
+            assert ring.write(data)
+            ring.drain(lambda view: records.append(bytes(view)))
+            assert records[-1] == data
+        assert ring.write(b"a" * 30)
+        assert not ring.write(b"b" * 30)
+        ring.drain(lambda view: records.append(bytes(view)))
+        assert ring.write(b"b" * 30)
+    finally:
+        ring.close()
+        ring.unlink()
+
+
+def test_ring_bad_record():
+    ring = Ring.create(64)
+    records = []
+
+    def consume(view):
+        if bytes(view) == b"bad":
+            raise ValueError("bad record")
+        records.append(bytes(view))
+
+    try:
+        ring.write(b"bad")
+        ring.write(b"good")
+        ring.drain(consume)
+        # the bad record is skipped, not read again
+        ring.write(b"next")
+        ring.drain(consume)
+        assert records == [b"good", b"next"]
+    finally:
+        ring.close()
+        ring.unlink()
+
+
+@pytest.mark.asyncio
+async def test_shm_transport(tmp_path):
+    path = str(tmp_path / "S")
+    collector = Collector()
+    r = SharedMemoryReceiver(path)
+    await r.task(collector)
+    e = SharedMemoryEmitter(encoder=lambda m: m.data, size=1024)
+    await e.bulk_send([Packet(b'{"n":%d}' % i, path) for i in range(3)])
+    await e.send(Packet(b'{"n":3}', path))
+    for _ in range(100):
+        if len(collector.received) == 4:
+            break
+        await asyncio.sleep(0.001)
+    assert collector.received == [{"n": i} for i in range(4)]
+    assert e.stats["packets"] == 2
+    await r.stop()
+    await e.stop()
+
+
+@pytest.mark.asyncio
+async def test_shm_skipped_doorbell(tmp_path):
+    path = str(tmp_path / "S")
+    collector = Collector()
+    r = SharedMemoryReceiver(path)
+    await r.task(collector)
+    first = SharedMemoryEmitter(encoder=lambda m: m.data, size=1024)
+    second = SharedMemoryEmitter(encoder=lambda m: m.data, size=1024)
+    await first.send(Packet(b'{"n":1}', path))
+    await second.send(Packet(b'{"n":2}', path))
+    for _ in range(100):
+        if len(collector.received) == 2:
+            break
+        await asyncio.sleep(0.001)
+
+    # as if the pipe was full when the first emitter rang
+    ring, _ = first.peer(path)
+    ring.write(b'[{"n":3}]')
+    await second.send(Packet(b'{"n":4}', path))
+    for _ in range(100):
+        if len(collector.received) == 4:
+            break
+        await asyncio.sleep(0.001)
+    assert sorted(m["n"] for m in collector.received) == [1, 2, 3, 4]
+    await r.stop()
+    await first.stop()
+    await second.stop()
+
+
+@pytest.mark.asyncio
+async def test_shm_closes_stopped_rings(tmp_path):
+    path = str(tmp_path / "S")
+    collector = Collector()
+    r = SharedMemoryReceiver(path)
+    await r.task(collector)
+
+    async def wait(n, rings):
+        for _ in range(100):
+            if len(collector.received) == n and len(r.rings) == rings:
+                break
+            await asyncio.sleep(0.001)
+
+    e = SharedMemoryEmitter(encoder=lambda m: m.data, size=1024)
+    await e.send(Packet(b'{"n":1}', path))
+    await wait(1, 1)
+    assert len(r.rings) == 1
+    await e.stop()
+    await wait(1, 0)
+    assert not r.rings
+
+    # a ring whose emitter exited without stopping is closed once another attaches
+    e = SharedMemoryEmitter(encoder=lambda m: m.data, size=1024)
+    await e.send(Packet(b'{"n":2}', path))
+    await wait(2, 1)
+    ring, _ = e.peer(path)
+    exited = subprocess.Popen(["true"])
+    exited.wait()
+    ring.buf[24:32] = exited.pid.to_bytes(8, "little")
+    restarted = SharedMemoryEmitter(encoder=lambda m: m.data, size=1024)
+    await restarted.send(Packet(b'{"n":3}', path))
+    await wait(3, 1)
+    assert list(r.rings) == [restarted.peer(path)[0].name]
+    assert [m["n"] for m in collector.received] == [1, 2, 3]
+    await r.stop()
+    await e.stop()
+    await restarted.stop()
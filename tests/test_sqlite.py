@@ -0,0 +1,118 @@
+import pytest
+from bspl.parsers.bspl import parse
+from bspl.adapter import Adapter
+from bspl.adapter.emitter import MockEmitter
+from bspl.adapter.receiver import MockReceiver
+from bspl.adapter.sqlite import SQLiteStore
+
+specification = parse(
+    """
+Logistics {
+  roles Merchant, Wrapper, Labeler, Packer
+  parameters out orderID key, out itemID key, out item, out status
+  private address, label, wrapping
+
+  Merchant -> Labeler: RequestLabel[out orderID key, out address]
+  Merchant -> Wrapper: RequestWrapping[in orderID key, out itemID key, out item]
+  Wrapper -> Packer: Wrapped[in orderID key, in itemID key, in item, out wrapping]
+  Labeler -> Packer: Labeled[in orderID key, in address, out label]
+  Packer -> Merchant: Packed[in orderID key, in itemID key, in wrapping, in label, out status]
+}
+"""
+)
+
+logistics = specification.export("Logistics")
+from Logistics import Merchant, Wrapper, Labeler, Packer
+from Logistics import RequestLabel, RequestWrapping, Wrapped, Labeled, Packed
+
+systems = {
+    0: {
+        "protocol": logistics,
+        "roles": {Merchant: "M", Wrapper: "W", Labeler: "L", Packer: "P"},
+    }
+}
+
+agents = {
+    "M": [("localhost", 8001)],
+    "W": [("localhost", 8002)],
+    "L": [("localhost", 8003)],
+    "P": [("localhost", 8004)],
+}
+
+a = Adapter("P", systems, agents, emitter=MockEmitter())  # for injection
+
+
+def test_sqlite_store(tmp_path):
+    path = tmp_path / "history.db"
+    h = SQLiteStore(systems, path, cache_size=1)
+    for i in range(3):
+        h.add(Labeled(orderID=i, address="home", label=str(i), system=0))
+        h.add(Wrapped(orderID=i, itemID=0, item="ball", wrapping="paper", system=0))
+    assert len(h.cache) == 1
+
+    # evicted enactments are loaded back from the database
+    c = h.contexts[0]["orderID"][0]
+    assert c.bindings["label"] == "0"
+    assert c["itemID"][0].bindings["item"] == "ball"
+
+    assert h.is_duplicate(Labeled(orderID=1, address="home", label="1", system=0))
+    assert not h.is_duplicate(Labeled(orderID=5, address="home", label="5", system=0))
+    with pytest.raises(Exception):
+        h.is_duplicate(Labeled(orderID=1, address="work", label="1", system=0))
+    assert not h.check_integrity(
+        Wrapped(orderID=2, itemID=0, item="bat", wrapping="paper", system=0)
+    )
+
+    assert len(list(h.messages(Labeled))) == 3
+    assert [m["label"] for m in h.messages(Labeled, orderID=2)] == ["2"]
+    assert len(list(h.messages(orderID=lambda o: o > 0))) == 4
+
+    # committed messages survive reopening the database
+    h.close()
+    h = SQLiteStore(systems, path)
+    assert len(list(h.messages())) == 6
+    assert h.is_duplicate(Labeled(orderID=1, address="home", label="1", system=0))
+
+
+@pytest.mark.asyncio
+async def test_sqlite_adapter():
+    history = SQLiteStore(systems, cache_size=1)
+    a = Adapter(
+        "P",
+        systems,
+        agents,
+        emitter=MockEmitter(),
+        receiver=MockReceiver(),
+        history=history,
+    )
+    assert a.history is history
+    await a.receive(
+        Labeled(orderID=1, address="home", label="0001", system=0).serialize()
+    )
+    await a.receive(
+        Wrapped(orderID=1, itemID=0, item="ball", wrapping="paper", system=0).serialize()
+    )
+    await a.update()
+    await a.update()
+    assert {m.schema for m in a.enabled_messages.messages()} == {Packed}
+
+
+def test_sqlite_sharded(tmp_path):
+    path = tmp_path / "history.db"
+    h = SQLiteStore(systems, path)
+    # nothing is opened until the store is used, so workers can fork safely
+    h.sharded(2)
+    h.shard(1)
+    h.add(Labeled(orderID=1, address="home", label="1", system=0))
+    h.close()
+    assert not path.exists()
+    assert len(list(SQLiteStore(systems, tmp_path / "history-shard-1.db").messages())) == 1
+
+    h = SQLiteStore(systems, path)
+    h.add(Labeled(orderID=1, address="home", label="1", system=0))
+    with pytest.raises(Exception):
+        h.sharded(2)
+    h.close()
+    # an unsharded database can't be split
+    with pytest.raises(Exception):
+        SQLiteStore(systems, path).sharded(2)
@@ -4,7 +4,8 @@ import pytest
 import bspl
 from bspl.parsers.bspl import parse
 from bspl.adapter import Adapter
-from bspl.adapter.store import Store
+from bspl.adapter.store import Store, Tombstone
+from bspl.adapter.retention import Retention
 
 specification = parse(
     """
@@ -23,7 +24,7 @@ Logistics {
 )
 
 logistics = specification.export("Logistics")
-from Logistics import Packer, Wrapped, RequestLabel, Labeled, Packed
+from Logistics import Packer, Wrapped, RequestLabel, Labeled, Packed, RequestWrapping
 
 systems = {
     0: {
@@ -136,3 +137,182 @@ def test_store_matching_contexts(h):
     print([c.bindings for c in contexts])
     assert len(contexts) == 3
     assert h.contexts[0]["orderID"][1].all_bindings["orderID"] == [1]
+
+
+def test_context_bindings_cache(h):
+    m = Labeled(orderID=1, address="home", label="0001", system=0)
+    h.add(m)
+    m2 = Wrapped(orderID=1, itemID=0, item="ball", wrapping="paper", system=0)
+    h.add(m2)
+    c = h.contexts[0]["orderID"][1]
+    sub = c["itemID"][0]
+    assert sub.bindings is sub.bindings
+    assert sub.bindings["label"] == "0001"
+
+    # adding to an ancestor is visible in the subcontext
+    c.add(RequestLabel(orderID=1, address="work", system=0))
+    assert sub.bindings["address"] == "work"
+
+    # own bindings take precedence over the parent's
+    sub.add(Wrapped(orderID=1, itemID=0, item="bat", wrapping="box", system=0))
+    assert sub.bindings["item"] == "bat"
+    assert "item" not in c.bindings
+
+
+def test_store_indexes():
+    h = Store(systems, index=True)
+    h.add_index("orderID")
+    for i in range(3):
+        h.add(Labeled(orderID=i, address="home", label=str(i), system=0))
+        h.add(Wrapped(orderID=i, itemID=0, item="ball", wrapping="paper", system=0))
+
+    assert len(list(h.messages(Labeled))) == 3
+    assert list(h.messages(Labeled, orderID=1)) == [
+        Labeled(orderID=1, address="home", label="1", system=0)
+    ]
+    assert len(list(h.messages(orderID=2))) == 2
+    assert len(list(h.messages(Wrapped, orderID=lambda o: o > 0))) == 2
+
+    # replacing a message in its context replaces its index entries
+    h.add(Labeled(orderID=1, address="work", label="1", system=0))
+    assert [m["address"] for m in h.messages(Labeled, orderID=1)] == ["work"]
+    assert len(list(h.messages(Labeled))) == 3
+
+    # indexed queries agree with a full scan
+    scan = Store(systems)
+    for m in h.messages():
+        scan.add(m)
+    assert set(scan.messages(Wrapped, orderID=0)) == set(h.messages(Wrapped, orderID=0))
+
+
+def test_store_index_undeclared():
+    h = Store(systems, index=True)
+    with pytest.raises(Exception):
+        h.add_index("buyer")
+
+
+def test_lookup_does_not_allocate(h):
+    m = Wrapped(orderID=1, itemID=0, item="ball", wrapping="paper", system=0)
+    h.add(m)
+    assert h.lookup(m) is h.context(m)
+
+    other = Wrapped(orderID=1, itemID=1, item="bat", wrapping="paper", system=0)
+    c = h.lookup(other)
+    assert 1 not in h.contexts[0]["orderID"][1]["itemID"]
+    # the detached context still sees the bindings of its ancestors
+    assert c.parent is h.contexts[0]["orderID"][1]
+    assert h.check_integrity(other)
+    assert not h.is_duplicate(other)
+    assert 1 not in h.contexts[0]["orderID"][1]["itemID"]
+
+
+def test_duplicate_filter():
+    h = Store(systems, dedup=True)
+    m = Labeled(orderID=1, address="home", label="0001", system=0)
+    assert not h.is_duplicate(m)
+    h.add(m)
+    assert h.is_duplicate(Labeled(orderID=1, address="home", label="0001", system=0))
+    with pytest.raises(Exception):
+        h.is_duplicate(Labeled(orderID=1, address="work", label="0001", system=0))
+
+
+def test_duplicate_hash_collision(monkeypatch):
+    # every payload collides
+    monkeypatch.setattr(bspl.adapter.store, "payload_hash", lambda m: 0)
+    h = Store(systems, dedup=True)
+    h.add(Labeled(orderID=1, address="home", label="0001", system=0))
+
+    # the stored message answers without walking the context tree
+    def lookup(message, schema=None):
+        raise AssertionError("walked the context tree")
+
+    monkeypatch.setattr(h, "lookup", lookup)
+    assert h.is_duplicate(Labeled(orderID=1, address="home", label="0001", system=0))
+    with pytest.raises(Exception):
+        h.is_duplicate(Labeled(orderID=1, address="work", label="0001", system=0))
+
+
+def enact(h, orderID, itemID):
+    h.add(RequestLabel(orderID=orderID, address="home", system=0))
+    h.add(Labeled(orderID=orderID, address="home", label="0001", system=0))
+    h.add(RequestWrapping(orderID=orderID, itemID=itemID, item="ball", system=0))
+    h.add(
+        Wrapped(orderID=orderID, itemID=itemID, item="ball", wrapping="paper", system=0)
+    )
+    packed = Packed(
+        orderID=orderID,
+        itemID=itemID,
+        wrapping="paper",
+        label="0001",
+        status="packed",
+        system=0,
+    )
+    h.add(packed)
+    return packed
+
+
+def test_retention_evicts_completed(monkeypatch):
+    h = Store(systems, index=True, dedup=True, retention=Retention(count=0))
+    packed = enact(h, 1, 0)
+    item = h.contexts[0]["orderID"][1]["itemID"][0]
+    assert isinstance(item, Tombstone)
+    assert not list(h.messages(Packed))
+
+    # the tombstone still answers duplicate and integrity checks
+    assert h.is_duplicate(packed)
+    wrapped = Wrapped(orderID=1, itemID=0, item="bat", wrapping="paper", system=0)
+    assert not h.check_integrity(wrapped)
+    with pytest.raises(Exception):
+        h.is_duplicate(wrapped)
+
+    # other enactments are unaffected
+    h.add(RequestWrapping(orderID=1, itemID=1, item="bat", system=0))
+    assert not h.is_duplicate(
+        RequestWrapping(orderID=1, itemID=2, item="bat", system=0)
+    )
+    assert len(list(h.messages(RequestWrapping))) == 1
+
+    # evicted keys are still remembered, so no check walks the context tree
+    def lookup(message, schema=None):
+        raise AssertionError("walked the context tree")
+
+    monkeypatch.setattr(h, "lookup", lookup)
+    assert h.is_duplicate(packed)
+    assert not h.is_duplicate(
+        RequestWrapping(orderID=2, itemID=0, item="bat", system=0)
+    )
+
+
+def test_retention_count():
+    r = Retention(count=2)
+    h = Store(systems, retention=r)
+    for i in range(5):
+        enact(h, i, 0)
+    assert len(r.completed) == 2
+    assert r.evicted == 3
+    assert isinstance(h.contexts[0]["orderID"][0]["itemID"][0], Tombstone)
+    assert not isinstance(h.contexts[0]["orderID"][4]["itemID"][0], Tombstone)
+
+
+def test_retention_memory():
+    r = Retention(memory=1)
+    h = Store(systems, retention=r)
+    enact(h, 1, 0)
+    assert r.evicted == 1
+    assert r.size == 0
+
+
+@pytest.mark.asyncio
+async def test_retention_age():
+    r = Retention(age=0.05)
+    h = Store(systems, retention=r)
+    enact(h, 1, 0)
+    # not yet expired when it completes
+    assert r.evicted == 0
+
+    # expires without any other enactment completing
+    task = asyncio.get_running_loop().create_task(r.task(h))
+    await asyncio.sleep(0.2)
+    task.cancel()
+    assert r.evicted == 1
+    assert isinstance(h.contexts[0]["orderID"][1]["itemID"][0], Tombstone)